@@ -0,0 +1,49 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, List
+
+from chia.types.blockchain_format.program import Program, SerializedProgram
+
+
+CLSP_CACHE_DIR = Path(".clsp_cache")
+
+# compiled puzzles already loaded by this process, keyed by source digest
+_compiled_clsp: Dict[str, Program] = {}
+
+
+def clsp_source_digest(source: Path, searches: List[Path]) -> str:
+    """Hash a chialisp source together with every library it could include"""
+    digest = hashlib.sha256(source.read_bytes())
+    for search in searches:
+        for lib in sorted(search.glob("*.clib")):
+            digest.update(lib.name.encode())
+            digest.update(lib.read_bytes())
+    return digest.hexdigest()
+
+
+def load_clsp_relative(filename: str, search_paths: List[Path] = [Path("include/")]):
+    base = Path().parent.resolve()
+    source = base / filename
+    target = base / f"{filename}.hex"
+    searches = [base / s for s in search_paths]
+
+    digest = clsp_source_digest(source, searches)
+    if digest in _compiled_clsp:
+        return _compiled_clsp[digest]
+
+    cached = base / CLSP_CACHE_DIR / f"{digest}.clvm"
+    if cached.exists():
+        clvm_blob = cached.read_bytes()
+    else:
+        # the compiler is only needed, and imported, when the cache misses
+        from clvm_tools.clvmc import compile_clvm_text
+
+        clvm_blob = bytes(compile_clvm_text(source.read_text(), searches).as_bin())
+        target.write_text(clvm_blob.hex())
+        cached.parent.mkdir(exist_ok=True)
+        cached.write_bytes(clvm_blob)
+
+    sp = SerializedProgram.from_bytes(clvm_blob)
+    program = Program.from_bytes(bytes(sp))
+    _compiled_clsp[digest] = program
+    return program
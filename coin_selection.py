@@ -0,0 +1,107 @@
+from typing import AbstractSet, Callable, Dict, List, Optional, Tuple, Union
+
+from blspy import G1Element
+
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import puzzle_for_pk
+
+
+# A strategy gets the spendable coins, the target amount and the most coins it may
+# use, and returns the coins to spend or None if it can't cover the amount.
+Strategy = Callable[[List[Coin], int, int], Optional[List[Coin]]]
+
+
+def exact_match(coins: List[Coin], amount: int, max_coins: int) -> Optional[List[Coin]]:
+    """A single coin of exactly the amount, so no change coin is created"""
+    return next(([c] for c in coins if c.amount == amount), None)
+
+
+def smallest_sufficient(coins: List[Coin], amount: int, max_coins: int) -> Optional[List[Coin]]:
+    """The smallest single coin that covers the amount, leaving large coins whole"""
+    candidates = [c for c in coins if c.amount >= amount]
+    if not candidates:
+        return None
+    return [min(candidates, key=lambda c: c.amount)]
+
+
+def largest(coins: List[Coin], amount: int, max_coins: int) -> Optional[List[Coin]]:
+    """The largest single coin, if it covers the amount"""
+    if not coins:
+        return None
+    coin = max(coins, key=lambda c: c.amount)
+    return [coin] if coin.amount >= amount else None
+
+
+def combine(coins: List[Coin], amount: int, max_coins: int) -> Optional[List[Coin]]:
+    """Smallest coins first until the amount is covered, which folds dust back into one change coin"""
+    selected = []
+    total = 0
+    for coin in sorted(coins, key=lambda c: c.amount):
+        selected.append(coin)
+        total += coin.amount
+        if total >= amount:
+            break
+    if total < amount:
+        return None
+    # drop small coins that the larger ones made unnecessary
+    for coin in list(selected):
+        if total - coin.amount >= amount:
+            selected.remove(coin)
+            total -= coin.amount
+    if len(selected) > max_coins:
+        # too many small coins, fall back to the largest ones
+        selected = sorted(coins, key=lambda c: c.amount, reverse=True)[:max_coins]
+        if sum(c.amount for c in selected) < amount:
+            return None
+    return selected
+
+
+def best_fit(coins: List[Coin], amount: int, max_coins: int) -> Optional[List[Coin]]:
+    """An exact coin if there is one, otherwise the smallest sufficient coin, otherwise combine"""
+    return (
+        exact_match(coins, amount, max_coins)
+        or smallest_sufficient(coins, amount, max_coins)
+        or combine(coins, amount, max_coins)
+    )
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "exact": exact_match,
+    "best_fit": best_fit,
+    "smallest_sufficient": smallest_sufficient,
+    "largest": largest,
+    "combine": combine,
+}
+
+
+class CoinSelector:
+    """Picks standard transaction coins owned by a fixed set of keys with one node query"""
+
+    def __init__(self, node_client, puzzle_hashes: Dict[bytes32, G1Element]):
+        self.node_client = node_client
+        # puzzle hash -> public key, precomputed so only the selected coins' puzzles get built
+        self.puzzle_hashes = puzzle_hashes
+
+    async def spendable_coins(self) -> List[Coin]:
+        records = await self.node_client.get_coin_records_by_puzzle_hashes(
+            list(self.puzzle_hashes.keys()), include_spent_coins=False
+        )
+        return [cr.coin for cr in records if not cr.spent]
+
+    async def select(
+        self,
+        amount: int,
+        strategy: Union[str, Strategy] = "best_fit",
+        max_coins: int = 1,
+        exclude: AbstractSet[bytes32] = frozenset(),
+    ) -> List[Tuple[Coin, Program]]:
+        if isinstance(strategy, str):
+            strategy = STRATEGIES[strategy]
+        # exclude holds coin ids already spent by bundles still waiting in the mempool
+        coins = [c for c in await self.spendable_coins() if c.name() not in exclude]
+        selected = strategy(coins, amount, max_coins)
+        if not selected:
+            raise ValueError("No spendable coins found")
+        return [(coin, puzzle_for_pk(self.puzzle_hashes[coin.puzzle_hash])) for coin in selected]
@@ -8,7 +8,6 @@ from chia.util.hash import std_hash
 from clvm.casts import int_to_bytes, int_from_bytes
 from chia.util.byte_types import hexstr_to_bytes
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
-from chia.wallet.puzzles.load_clvm import load_clvm
 from chia.util.condition_tools import ConditionOpcode
 from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import (  # standard_transaction
     puzzle_for_pk,
@@ -23,20 +22,16 @@ from chia.wallet.lineage_proof import LineageProof
 from chia.wallet.puzzles import singleton_top_layer
 from chia.types.announcement import Announcement
 
-from sim import load_clsp_relative
 from nft_wallet import NFT
+import puzzles
+from puzzles import singleton_struct, singleton_struct_hash, p2_puzzle_hash_for_launcher, p2_puzzle_reveal_for_launcher
+from preflight import spend_cost
 
 
-SINGLETON_MOD = load_clvm("singleton_top_layer.clvm")
-SINGLETON_MOD_HASH = SINGLETON_MOD.get_tree_hash()
-LAUNCHER_PUZZLE = load_clsp_relative("clsp/nft_launcher.clsp")
-LAUNCHER_PUZZLE_HASH = LAUNCHER_PUZZLE.get_tree_hash()
-
 ESCAPE_VALUE = -113
 MELT_CONDITION = [ConditionOpcode.CREATE_COIN, 0, ESCAPE_VALUE]
-
-INNER_MOD = load_clsp_relative("clsp/creator_nft.clsp")
-P2_MOD = load_clsp_relative("clsp/p2_creator_nft.clsp")
+# the mempool rejects a spend bundle costing more than this fraction of a block
+MEMPOOL_COST_LIMIT_FACTOR = 0.5
 
 
 def run_singleton(full_puzzle: Program, solution: Program) -> List:
@@ -63,9 +58,41 @@ def run_singleton(full_puzzle: Program, solution: Program) -> List:
     return conds
 
 
-def make_inner(state: List, royalty: List) -> Program:
-    args = [INNER_MOD.get_tree_hash(), state, royalty]
-    return INNER_MOD.curry(*args)
+def singleton_child(coin_spend: CoinSpend) -> Coin:
+    """The singleton coin recreated by a singleton spend. It is the only odd CREATE_COIN."""
+    conds = run_singleton(coin_spend.puzzle_reveal.to_program(), coin_spend.solution.to_program())
+    create_cond = next(c for c in conds if c[0] == 51 and c[2] % 2 == 1)
+    return Coin(coin_spend.coin.name(), create_cond[1], create_cond[2])
+
+
+def make_inner(state: List, royalty: List, mod_hash: Optional[bytes32] = None) -> Program:
+    """The creator NFT inner puzzle, by default the one new NFTs are launched with"""
+    if mod_hash is None:
+        mod_hash = puzzles.inner_mod_hashes()[0]
+    args = [mod_hash, state, royalty]
+    return puzzles.inner_mod(mod_hash).curry(*args)
+
+
+def make_singleton_puzzle(nft: NFT) -> Tuple[SerializedProgram, bytes32]:
+    """The serialized singleton puzzle of an NFT's current coin and the tree hash of its inner puzzle.
+
+    Spliced together from the cached serialized mods and hashed from their cached tree hashes,
+    so only the curried state and royalty are serialized and hashed for each spend.
+    """
+    inner_args = [Program.to(arg) for arg in (nft.mod_hash, nft.state(), nft.royalty)]
+    inner_puzzle_hash = puzzles.curried_tree_hash(nft.mod_hash, *[arg.get_tree_hash() for arg in inner_args])
+    puzzle_hash = puzzles.curried_tree_hash(
+        puzzles.SINGLETON_MOD_HASH, singleton_struct_hash(nft.launcher_id), inner_puzzle_hash
+    )
+    assert puzzle_hash == nft.puzzle_hash
+
+    inner_puzzle = puzzles.curry_serialized(
+        puzzles.serialized_inner_mod(nft.mod_hash), *[bytes(arg) for arg in inner_args]
+    )
+    singleton_puzzle = puzzles.curry_serialized(
+        puzzles.SINGLETON_MOD_SERIALIZED, bytes(singleton_struct(nft.launcher_id)), bytes(inner_puzzle)
+    )
+    return singleton_puzzle, inner_puzzle_hash
 
 
 def make_solution(new_state, payment_info):
@@ -78,21 +105,29 @@ def get_eve_coin_from_launcher(launcher_spend):
     return Coin(launcher_spend.coin.name(), create_cond[1], create_cond[2])
 
 
-def make_launcher_spend(found_coin: Coin, amount: int, state: List, royalty: List, key_value_list: Tuple):
+def make_launcher_spend(
+    found_coin: Coin,
+    amount: int,
+    state: List,
+    royalty: List,
+    key_value_list: Tuple,
+    inner_mod_hash: Optional[bytes32] = None,
+):
     # key_value_list must be a tuple, which can contain lists, but the top-level
     # must be 2 elements
-    launcher_coin = Coin(found_coin.name(), LAUNCHER_PUZZLE_HASH, amount)
-    args = [INNER_MOD.get_tree_hash(), state, royalty]
-    curried = INNER_MOD.curry(*args)
-    full_puzzle = SINGLETON_MOD.curry((SINGLETON_MOD_HASH, (launcher_coin.name(), LAUNCHER_PUZZLE_HASH)), curried)
+    if inner_mod_hash is None:
+        inner_mod_hash = puzzles.inner_mod_hashes()[0]
+    launcher_coin = Coin(found_coin.name(), puzzles.LAUNCHER_PUZZLE_HASH, amount)
+    curried = make_inner(state, royalty, inner_mod_hash)
+    full_puzzle = puzzles.SINGLETON_MOD.curry(singleton_struct(launcher_coin.name()), curried)
 
     solution = Program.to(
         [
             full_puzzle.get_tree_hash(),
-            SINGLETON_MOD_HASH,
+            puzzles.SINGLETON_MOD_HASH,
             launcher_coin.name(),
-            LAUNCHER_PUZZLE_HASH,
-            INNER_MOD.get_tree_hash(),
+            puzzles.LAUNCHER_PUZZLE_HASH,
+            inner_mod_hash,
             state,
             royalty,
             amount,
@@ -100,7 +135,7 @@ def make_launcher_spend(found_coin: Coin, amount: int, state: List, royalty: Lis
         ]
     )
 
-    return CoinSpend(launcher_coin, LAUNCHER_PUZZLE, solution)
+    return CoinSpend(launcher_coin, puzzles.LAUNCHER_PUZZLE, solution)
 
 
 def make_found_spend(
@@ -123,11 +158,10 @@ def make_found_spend(
 
 def make_eve_spend(state: List, royalty: List, launcher_spend: CoinSpend):
     eve_coin = get_eve_coin_from_launcher(launcher_spend)
-    args = [INNER_MOD.get_tree_hash(), state, royalty]
-    eve_inner_puzzle = INNER_MOD.curry(*args)
-    full_puzzle = SINGLETON_MOD.curry(
-        (SINGLETON_MOD_HASH, (launcher_spend.coin.name(), LAUNCHER_PUZZLE_HASH)), eve_inner_puzzle
-    )
+    # the launcher solution names the inner puzzle the NFT was launched with
+    inner_mod_hash = bytes32(launcher_spend.solution.to_program().at("rrrrf").as_atom())
+    eve_inner_puzzle = make_inner(state, royalty, inner_mod_hash)
+    full_puzzle = puzzles.SINGLETON_MOD.curry(singleton_struct(launcher_spend.coin.name()), eve_inner_puzzle)
 
     assert full_puzzle.get_tree_hash() == eve_coin.puzzle_hash
 
@@ -139,6 +173,35 @@ def make_eve_spend(state: List, royalty: List, launcher_spend: CoinSpend):
     return eve_spend
 
 
+def make_launch_chain(
+    found_coin: Coin, found_coin_puzzle: Program, launches: List[Tuple[int, List, List, Tuple]], max_cost: int
+) -> Tuple[List[CoinSpend], List[bytes32], int]:
+    """Launch several NFTs from one found coin, each found spend's change coin funding the next launch.
+
+    Launches are (amount, state, royalty, key_value_list). Stops before the launch that would take the
+    spends over max_cost or the coin's value, and returns the spends, launcher ids and total cost.
+    """
+    spends = []
+    launcher_ids = []
+    total_cost = 0
+    coin = found_coin
+    for amount, state, royalty, key_value_list in launches:
+        if amount > coin.amount:
+            break
+        launcher_spend = make_launcher_spend(coin, amount, state, royalty, key_value_list)
+        found_spend = make_found_spend(coin, found_coin_puzzle, launcher_spend, amount)
+        eve_spend = make_eve_spend(state, royalty, launcher_spend)
+        cost = sum(spend_cost(cs) for cs in (launcher_spend, found_spend, eve_spend))
+        if total_cost + cost > max_cost:
+            break
+        spends += [launcher_spend, found_spend, eve_spend]
+        launcher_ids.append(launcher_spend.coin.name())
+        total_cost += cost
+        # the change coin created by make_found_spend, so sibling launchers never share a parent
+        coin = Coin(coin.name(), coin.puzzle_hash, coin.amount - amount)
+    return spends, launcher_ids, total_cost
+
+
 def uncurry_inner_from_singleton(puzzle: Program):
     _, args = puzzle.uncurry()
     _, inner_puzzle = list(args.as_iter())
@@ -160,76 +223,80 @@ def uncurry_solution(solution: Program):
     return mod.as_python()[-1][0]
 
 
-def make_buy_spend(nft: NFT, new_state, payment_coin, payment_coin_puzzle):
-    old_state, royalty = uncurry_state_and_royalty(nft.last_spend.puzzle_reveal.to_program())
-    current_state = uncurry_solution(nft.last_spend.solution.to_program())
-    args = [INNER_MOD.get_tree_hash(), current_state, royalty]
-
-    current_inner_puzzle = INNER_MOD.curry(*args)
-    current_singleton_puzzle = SINGLETON_MOD.curry(
-        (SINGLETON_MOD_HASH, (nft.launcher_id, LAUNCHER_PUZZLE_HASH)), current_inner_puzzle
-    )
-
-    assert current_singleton_puzzle.get_tree_hash() == nft.puzzle_hash
-    assert nft.state()[0] != int_to_bytes(0)  # is for sale
-
-    price = int_from_bytes(nft.state()[1])
-
-    p2_puzzle = P2_MOD.curry(SINGLETON_MOD_HASH, nft.launcher_id, LAUNCHER_PUZZLE_HASH)
-    p2_coin = Coin(payment_coin.name(), p2_puzzle.get_tree_hash(), price)
+def make_purchase_spends(nft: NFT, new_state, payment_coin_id: bytes32) -> Tuple[CoinSpend, CoinSpend]:
+    """The singleton spend and the p2 spend paying for it, from a p2 coin created by payment_coin_id"""
+    assert nft.is_for_sale()
+    current_singleton_puzzle, current_inner_puzzle_hash = make_singleton_puzzle(nft)
 
-    r = nft.last_spend.puzzle_reveal.to_program().uncurry()
-    if r is not None:
-        _, args = r
-        _, inner_puzzle = list(args.as_iter())
-        inner_puzzle_hash = inner_puzzle.get_tree_hash()
+    p2_puzzle = p2_puzzle_reveal_for_launcher(nft.launcher_id)
+    p2_coin = Coin(payment_coin_id, p2_puzzle_hash_for_launcher(nft.launcher_id), nft.price())
 
-    lineage_proof = LineageProof(nft.last_spend.coin.parent_coin_info, inner_puzzle_hash, nft.amount)
+    inner_solution = [new_state, p2_coin.name()]
+    singleton_solution = singleton_top_layer.solution_for_singleton(
+        nft.lineage_proof, nft.as_coin().amount, inner_solution
+    )
+    p2_solution = Program.to([current_inner_puzzle_hash, p2_coin.name(), new_state])
 
-    # lineage_proof = singleton_top_layer.lineage_proof_for_coinsol(nft.last_spend)
+    nft_spend = CoinSpend(nft.as_coin(), current_singleton_puzzle, singleton_solution)
+    p2_spend = CoinSpend(p2_coin, p2_puzzle, p2_solution)
+    return (nft_spend, p2_spend)
 
-    inner_solution = [new_state, p2_coin.name()]
-    singleton_solution = singleton_top_layer.solution_for_singleton(lineage_proof, nft.as_coin().amount, inner_solution)
 
-    # conds = run_singleton(current_singleton_puzzle, singleton_solution)
-    # print(conds)
+def make_buy_spend(nft: NFT, new_state, payment_coin, payment_coin_puzzle):
+    nft_spend, p2_spend = make_purchase_spends(nft, new_state, payment_coin.name())
+    price = nft.price()
 
-    p2_solution = Program.to([current_inner_puzzle.get_tree_hash(), p2_coin.name(), new_state])
     delegated_cond = [
-        [ConditionOpcode.CREATE_COIN, p2_puzzle.get_tree_hash(), price],
-        [ConditionOpcode.CREATE_COIN, payment_coin_puzzle.get_tree_hash(), payment_coin.amount - price],
+        [ConditionOpcode.CREATE_COIN, p2_spend.coin.puzzle_hash, price],
+        [ConditionOpcode.CREATE_COIN, payment_coin.puzzle_hash, payment_coin.amount - price],
     ]
     delegated_puz = Program.to((1, delegated_cond))
     delegated_sol = Program.to([[], delegated_puz, []])
-    # make coin spends
-    nft_spend = CoinSpend(nft.as_coin(), current_singleton_puzzle, singleton_solution)
-    p2_spend = CoinSpend(p2_coin, p2_puzzle, p2_solution)
     payment_spend = CoinSpend(payment_coin, payment_coin_puzzle, delegated_sol)
 
     return (nft_spend, p2_spend, payment_spend)
 
 
-def make_update_spend(nft: NFT, new_state):
-    old_state, royalty = uncurry_state_and_royalty(nft.last_spend.puzzle_reveal.to_program())
-    current_state = uncurry_solution(nft.last_spend.solution.to_program())
-    args = [INNER_MOD.get_tree_hash(), current_state, royalty]
-
-    current_inner_puzzle = INNER_MOD.curry(*args)
-    current_singleton_puzzle = SINGLETON_MOD.curry(
-        (SINGLETON_MOD_HASH, (nft.launcher_id, LAUNCHER_PUZZLE_HASH)), current_inner_puzzle
-    )
-
-    assert current_singleton_puzzle.get_tree_hash() == nft.puzzle_hash
+def make_sweep_buy_spends(
+    purchases: List[Tuple[NFT, List]], payment_coins: List[Tuple[Coin, Program]]
+) -> List[CoinSpend]:
+    """Buy every (nft, new_state) in one bundle, paid for by all the payment coins together.
+
+    The first payment coin creates every p2 coin and the change, which goes back to its own puzzle
+    hash. The other coins only assert its announcement, so none of them can be spent without it.
+    """
+    assert len({nft.launcher_id for nft, _ in purchases}) == len(purchases)
+    primary_coin, primary_puzzle = payment_coins[0]
+    total = sum(coin.amount for coin, _ in payment_coins)
+    price = sum(nft.price() for nft, _ in purchases)
+    assert total >= price
+
+    spends = []
+    conditions = []
+    for nft, new_state in purchases:
+        nft_spend, p2_spend = make_purchase_spends(nft, new_state, primary_coin.name())
+        spends += [nft_spend, p2_spend]
+        conditions.append([ConditionOpcode.CREATE_COIN, p2_spend.coin.puzzle_hash, nft.price()])
+    if total > price:
+        conditions.append([ConditionOpcode.CREATE_COIN, primary_coin.puzzle_hash, total - price])
+
+    message = std_hash(b"".join(coin.name() for coin, _ in payment_coins))
+    conditions.append([ConditionOpcode.CREATE_COIN_ANNOUNCEMENT, message])
+    spends.append(CoinSpend(primary_coin, primary_puzzle, Program.to([[], Program.to((1, conditions)), []])))
+
+    announcement = Announcement(primary_coin.name(), message)
+    for coin, puzzle in payment_coins[1:]:
+        delegated_puz = Program.to((1, [[ConditionOpcode.ASSERT_COIN_ANNOUNCEMENT, announcement.name()]]))
+        spends.append(CoinSpend(coin, puzzle, Program.to([[], delegated_puz, []])))
+    return spends
 
-    r = nft.last_spend.puzzle_reveal.to_program().uncurry()
-    if r is not None:
-        _, args = r
-        _, inner_puzzle = list(args.as_iter())
-        inner_puzzle_hash = inner_puzzle.get_tree_hash()
 
-    lineage_proof = LineageProof(nft.last_spend.coin.parent_coin_info, inner_puzzle_hash, nft.amount)
+def make_update_spend(nft: NFT, new_state):
+    current_singleton_puzzle, _ = make_singleton_puzzle(nft)
 
     inner_solution = [new_state, [], []]
-    singleton_solution = singleton_top_layer.solution_for_singleton(lineage_proof, nft.as_coin().amount, inner_solution)
+    singleton_solution = singleton_top_layer.solution_for_singleton(
+        nft.lineage_proof, nft.as_coin().amount, inner_solution
+    )
 
     return CoinSpend(nft.as_coin(), current_singleton_puzzle, singleton_solution)
@@ -2,11 +2,13 @@ import click
 import asyncio
 from functools import wraps
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from chia.util.byte_types import hexstr_to_bytes
-
-from nft_manager import NFTManager
-from nft_wallet import NFT
+# the chia stack, config and puzzles are imported inside the commands that need them,
+# so `nft --help` and the daemon-backed reads start quickly
+if TYPE_CHECKING:
+    from nft_manager import NFTManager
+    from nft_wallet import NFT
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
@@ -19,7 +21,7 @@ def coro(f):
     return wrapper
 
 
-def print_nft(nft: NFT):
+def print_nft(nft: "NFT"):
     print("\n")
     print("-" * 64)
     print(f"NFT ID:\n{nft.launcher_id.hex()}\n")
@@ -37,6 +39,12 @@ def print_nft(nft: NFT):
     print("\n")
 
 
+def print_cost(manager: "NFTManager", tx_id) -> None:
+    report = manager.preflight_reports.get(tx_id)
+    if report:
+        print(f"Cost: {report}")
+
+
 @click.group(
     help=f"\n  CreatorNFT v0.1\n",
     epilog="Try 'nft list' or 'nft sale' to see some NFTs",
@@ -50,19 +58,56 @@ def cli(ctx: click.Context):
 @cli.command("init", short_help="Start the nft database")
 @coro
 async def init_cmd():
+    from nft_manager import NFTManager
+
     manager = NFTManager()
     await manager.connect()
     await manager.sync()
     await manager.close()
 
 
+async def read_manager(needs_owner: bool = False, **kwargs) -> "NFTManager":
+    """A manager for read-only commands, answering from the daemon's store when one is running.
+
+    Otherwise only the node and the store are opened, plus the wallet if needs_owner
+    is set and the owner key isn't cached yet.
+    """
+    from nft_manager import NFTManager
+
+    manager = NFTManager(**kwargs)
+    if not await manager.open_store():
+        await manager.connect(read_only=True)
+        if needs_owner and manager.nft_pk is None:
+            await manager.connect()
+    return manager
+
+
+@cli.command("daemon", short_help="Keep the local NFT index current")
+@click.option(
+    "-i", "--interval", type=float, default=5, show_default=True, help="Seconds between checks for a new peak"
+)
+@click.pass_context
+@coro
+async def daemon_cmd(ctx, interval):
+    from nft_manager import NFTManager
+
+    manager = NFTManager()
+    # the daemon does its first sync itself, so the heartbeat is written while it runs
+    await manager.connect(sync=False)
+    try:
+        await manager.run_daemon(poll_interval=interval)
+    finally:
+        await manager.close()
+
+
 @cli.command("view", short_help="View a single NFT by id")
 @click.option("-n", "--nft-id", required=True, type=str)
 @click.pass_context
 @coro
 async def view_cmd(ctx, nft_id):
-    manager = NFTManager()
-    await manager.connect()
+    from chia.util.byte_types import hexstr_to_bytes
+
+    manager = await read_manager()
     nft = await manager.view_nft(hexstr_to_bytes(nft_id))
     if nft:
         print_nft(nft)
@@ -71,12 +116,22 @@ async def view_cmd(ctx, nft_id):
     await manager.close()
 
 
+def fan_out_options(f):
+    f = click.option(
+        "-c", "--concurrency", type=int, default=16, show_default=True, help="NFTs to resolve at the same time"
+    )(f)
+    f = click.option(
+        "-t", "--timeout", type=float, default=30, show_default=True, help="Seconds to wait on one NFT before skipping"
+    )(f)
+    return f
+
+
 @cli.command("list", short_help="Show CreatorNFT version")
+@fan_out_options
 @click.pass_context
 @coro
-async def list_cmd(ctx) -> None:
-    manager = NFTManager()
-    await manager.connect()
+async def list_cmd(ctx, concurrency, timeout) -> None:
+    manager = await read_manager(needs_owner=True, concurrency=concurrency, nft_timeout=timeout)
     nfts = await manager.get_my_nfts()
     await manager.close()
     for nft in nfts:
@@ -84,11 +139,11 @@ async def list_cmd(ctx) -> None:
 
 
 @cli.command("list-for-sale", short_help="Show some NFTs for sale")
+@fan_out_options
 @click.pass_context
 @coro
-async def sale_cmd(ctx) -> None:
-    manager = NFTManager()
-    await manager.connect()
+async def sale_cmd(ctx, concurrency, timeout) -> None:
+    manager = await read_manager(needs_owner=True, concurrency=concurrency, nft_timeout=timeout)
     nfts = await manager.get_for_sale_nfts()
     for nft in nfts:
         print_nft(nft)
@@ -104,6 +159,8 @@ async def sale_cmd(ctx) -> None:
 @click.pass_context
 @coro
 async def launch_cmd(ctx, data, royalty, amount, price, for_sale) -> None:
+    from nft_manager import NFTManager, ConfirmationError, PreflightError
+
     assert price > 0
     assert amount % 2 == 1
     
@@ -117,11 +174,76 @@ async def launch_cmd(ctx, data, royalty, amount, price, for_sale) -> None:
     else:
         launch_state = [0, price]
     royalty = [royalty]
-    tx_id, launcher_id = await manager.launch_nft(amount, nft_data, launch_state, royalty)
+    try:
+        tx_id, launcher_id = await manager.launch_nft(amount, nft_data, launch_state, royalty)
+    except PreflightError as e:
+        print(f"\nNot pushed: {e}")
+        await manager.close()
+        return
     print(f"Transaction id: {tx_id}")
-    nft = await manager.wait_for_confirmation(tx_id, launcher_id)
-    print("\n\n NFT Launched!!")
-    print_nft(nft)
+    print_cost(manager, tx_id)
+    try:
+        nft = await manager.wait_for_confirmation(tx_id, launcher_id)
+        print("\n\n NFT Launched!!")
+        print_nft(nft)
+    except ConfirmationError as e:
+        print(f"\n{e}")
+    await manager.close()
+
+
+@cli.command("launch-batch", short_help="Launch an NFT for each data file, in as few transactions as possible")
+@click.option("-d", "--data", required=True, type=str, multiple=True, help="Data file, or directory of data files")
+@click.option("-r", "--royalty", required=True, type=int)
+@click.option("-a", "--amount", type=int, default=101)
+@click.option("-p", "--price", type=int, default=1000)
+@click.option("--for-sale/--not-for-sale", type=bool, default=False)
+@click.pass_context
+@coro
+async def launch_batch_cmd(ctx, data, royalty, amount, price, for_sale) -> None:
+    from nft_manager import NFTManager, ConfirmationError, PreflightError, PushError
+
+    assert price > 0
+    assert amount % 2 == 1
+
+    paths = []
+    for d in data:
+        path = Path(d)
+        paths += sorted(p for p in path.iterdir() if p.is_file()) if path.is_dir() else [path]
+    launches = []
+    for path in paths:
+        with open(path, "r") as f:
+            datastr = f.readlines()
+        launch_state = [10, price] if for_sale else [0, price]
+        launches.append((amount, ("CreatorNFT", "".join(datastr)), launch_state, [royalty]))
+
+    manager = NFTManager()
+    await manager.connect()
+    try:
+        bundles = await manager.launch_nfts(launches)
+    except (PreflightError, ValueError) as e:
+        # every bundle is funded and preflighted before the first push
+        print(f"\nNot pushed: {e}")
+        await manager.close()
+        return
+    except PushError as e:
+        print(f"\nNot all pushed: {e}")
+        if not e.bundles:
+            await manager.close()
+            return
+        # the bundles pushed before the rejected one still confirm
+        bundles = e.bundles
+    for tx_id, launcher_ids in bundles:
+        print(f"Transaction id: {tx_id} ({len(launcher_ids)} NFTs)")
+        print_cost(manager, tx_id)
+    try:
+        for tx_id, launcher_ids in bundles:
+            await manager.wait_for_confirmation(tx_id, launcher_ids[-1])
+        print(f"\n\n {sum(len(ids) for _, ids in bundles)} of {len(launches)} NFTs Launched!!")
+        for _, launcher_ids in bundles:
+            for nft in await manager.nft_wallet.get_nfts_by_launcher_ids(launcher_ids):
+                print_nft(nft)
+    except ConfirmationError as e:
+        print(f"\n{e}")
     await manager.close()
 
 
@@ -132,6 +254,9 @@ async def launch_cmd(ctx, data, royalty, amount, price, for_sale) -> None:
 @click.pass_context
 @coro
 async def update_cmd(ctx, nft_id, price, for_sale):
+    from chia.util.byte_types import hexstr_to_bytes
+    from nft_manager import NFTManager, ConfirmationError, PreflightError
+
     assert price > 0
     manager = NFTManager()
     await manager.connect()
@@ -139,11 +264,72 @@ async def update_cmd(ctx, nft_id, price, for_sale):
         new_state = [10, price]
     else:
         new_state = [0, price]
-    tx_id = await manager.update_nft(hexstr_to_bytes(nft_id), new_state)
+    try:
+        tx_id = await manager.update_nft(hexstr_to_bytes(nft_id), new_state)
+    except PreflightError as e:
+        print(f"\nNot pushed: {e}")
+        await manager.close()
+        return
     print(f"Transaction id: {tx_id}")
-    nft = await manager.wait_for_confirmation(tx_id, hexstr_to_bytes(nft_id))
-    print("\n\n NFT Updated!!")
-    print_nft(nft)
+    print_cost(manager, tx_id)
+    try:
+        nft = await manager.wait_for_confirmation(tx_id, hexstr_to_bytes(nft_id))
+        print("\n\n NFT Updated!!")
+        print_nft(nft)
+    except ConfirmationError as e:
+        print(f"\n{e}")
+    await manager.close()
+
+
+@cli.command("update-batch", short_help="Update many of your NFTs in one transaction")
+@click.option(
+    "-u",
+    "--update",
+    "updates",
+    required=True,
+    multiple=True,
+    type=(str, int, bool),
+    help="NFT id, price and whether it is for sale, e.g. -u <NFT-ID> 1200 true",
+)
+@click.pass_context
+@coro
+async def update_batch_cmd(ctx, updates):
+    from chia.types.blockchain_format.sized_bytes import bytes32
+    from chia.util.byte_types import hexstr_to_bytes
+    from nft_manager import NFTManager, ConfirmationError, PreflightError, PushError
+
+    assert all(price > 0 for _, price, _ in updates)
+    manager = NFTManager()
+    await manager.connect()
+    new_states = [
+        (bytes32(hexstr_to_bytes(nft_id)), [10 if for_sale else 0, price]) for nft_id, price, for_sale in updates
+    ]
+    try:
+        bundles = await manager.update_nfts(new_states)
+    except (PreflightError, ValueError) as e:
+        # every bundle is funded and preflighted before the first push
+        print(f"\nNot pushed: {e}")
+        await manager.close()
+        return
+    except PushError as e:
+        print(f"\nNot all pushed: {e}")
+        if not e.bundles:
+            await manager.close()
+            return
+        # the bundles pushed before the rejected one still confirm
+        bundles = e.bundles
+    for tx_id, launcher_ids in bundles:
+        print(f"Transaction id: {tx_id} ({len(launcher_ids)} NFTs)")
+        print_cost(manager, tx_id)
+    try:
+        for tx_id, launcher_ids in bundles:
+            await manager.wait_for_confirmation(tx_id, launcher_ids[-1])
+        print(f"\n\n {sum(len(ids) for _, ids in bundles)} of {len(updates)} NFTs Updated!!")
+        for _, launcher_ids in bundles:
+            for nft in await manager.nft_wallet.get_nfts_by_launcher_ids(launcher_ids):
+                print_nft(nft)
+    except ConfirmationError as e:
+        print(f"\n{e}")
     await manager.close()
 
 
@@ -154,6 +340,9 @@ async def update_cmd(ctx, nft_id, price, for_sale):
 @click.pass_context
 @coro
 async def buy_cmd(ctx, nft_id, price, for_sale):
+    from chia.util.byte_types import hexstr_to_bytes
+    from nft_manager import NFTManager, ConfirmationError, PreflightError
+
     assert price > 0
     manager = NFTManager()
     await manager.connect()
@@ -161,11 +350,62 @@ async def buy_cmd(ctx, nft_id, price, for_sale):
         new_state = [10, price]
     else:
         new_state = [0, price]
-    tx_id = await manager.buy_nft(hexstr_to_bytes(nft_id), new_state)
+    try:
+        tx_id = await manager.buy_nft(hexstr_to_bytes(nft_id), new_state)
+    except (PreflightError, ValueError) as e:
+        print(f"\nNot pushed: {e}")
+        await manager.close()
+        return
+    print(f"Transaction id: {tx_id}")
+    print_cost(manager, tx_id)
+    try:
+        nft = await manager.wait_for_confirmation(tx_id, hexstr_to_bytes(nft_id))
+        print("\n\n NFT Purchased!!")
+        print_nft(nft)
+    except ConfirmationError as e:
+        print(f"\n{e}")
+    await manager.close()
+
+
+@cli.command("sweep-buy", short_help="Buy several NFTs in one transaction")
+@click.option(
+    "-b",
+    "--buy",
+    "purchases",
+    required=True,
+    multiple=True,
+    type=(str, int, bool),
+    help="NFT id, your new price and whether it is for sale, e.g. -b <NFT-ID> 1500 false",
+)
+@click.option("-m", "--max-coins", type=int, default=10, show_default=True, help="Most coins to pay with")
+@click.pass_context
+@coro
+async def sweep_buy_cmd(ctx, purchases, max_coins):
+    from chia.types.blockchain_format.sized_bytes import bytes32
+    from chia.util.byte_types import hexstr_to_bytes
+    from nft_manager import NFTManager, ConfirmationError, PreflightError
+
+    assert all(price > 0 for _, price, _ in purchases)
+    manager = NFTManager()
+    await manager.connect()
+    new_states = [
+        (bytes32(hexstr_to_bytes(nft_id)), [10 if for_sale else 0, price]) for nft_id, price, for_sale in purchases
+    ]
+    try:
+        tx_id = await manager.sweep_buy_nfts(new_states, max_coins)
+    except (PreflightError, ValueError) as e:
+        print(f"\nNot pushed: {e}")
+        await manager.close()
+        return
     print(f"Transaction id: {tx_id}")
-    nft = await manager.wait_for_confirmation(tx_id, hexstr_to_bytes(nft_id))
-    print("\n\n NFT Purchased!!")
-    print_nft(nft)
+    print_cost(manager, tx_id)
+    try:
+        await manager.wait_for_confirmation(tx_id, new_states[0][0])
+        print(f"\n\n {len(new_states)} NFTs Purchased!!")
+        for nft in await manager.nft_wallet.get_nfts_by_launcher_ids([launcher_id for launcher_id, _ in new_states]):
+            print_nft(nft)
+    except ConfirmationError as e:
+        print(f"\n{e}")
     await manager.close()
 
 
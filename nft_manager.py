@@ -1,10 +1,12 @@
+import os
 import sys
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
 import aiosqlite
 from pathlib import Path
 import binascii
-import sqlite3
-from typing import Dict, List, Tuple, Optional, Union, Any
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple, Optional, Union, Any
 from blspy import AugSchemeMPL, G1Element, G2Element, PrivateKey
 
 from chia.types.blockchain_format.coin import Coin
@@ -14,7 +16,6 @@ from chia.util.hash import std_hash
 from clvm.casts import int_to_bytes, int_from_bytes
 from chia.util.byte_types import hexstr_to_bytes
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
-from chia.wallet.puzzles.load_clvm import load_clvm
 from chia.util.condition_tools import ConditionOpcode
 from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import (  # standard_transaction
     puzzle_for_pk,
@@ -22,40 +23,70 @@ from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import (  # standa
     DEFAULT_HIDDEN_PUZZLE_HASH,
 )
 from chia.util.db_wrapper import DBWrapper
-from chia.full_node.coin_store import CoinStore
 from chia.wallet.derive_keys import (
     master_sk_to_wallet_sk,
     master_sk_to_singleton_owner_sk,
 )
 from chia.wallet.derive_keys import master_sk_to_wallet_sk_unhardened
 from chia.types.coin_spend import CoinSpend
-from chia.wallet.sign_coin_spends import sign_coin_spends
 from chia.wallet.lineage_proof import LineageProof
 from chia.wallet.puzzles import singleton_top_layer
 from chia.types.announcement import Announcement
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.util.default_root import DEFAULT_ROOT_PATH
-from chia.rpc.rpc_client import RpcClient
 from chia.rpc.full_node_rpc_client import FullNodeRpcClient
 from chia.rpc.wallet_rpc_client import WalletRpcClient
 from chia.util.config import load_config
 from chia.util.ints import uint16, uint64
 from chia.util.bech32m import decode_puzzle_hash, encode_puzzle_hash
 
-from sim import load_clsp_relative
-from nft_wallet import NFT, NFTWallet
+from nft_wallet import NFT, NFTWallet, StoreVersionError
+from coin_selection import CoinSelector
+from signing import sign_coin_spends
+from preflight import preflight, PreflightError, PreflightReport
+import puzzles
 import driver
 
 
-SINGLETON_MOD = load_clvm("singleton_top_layer.clvm")
-SINGLETON_MOD_HASH = SINGLETON_MOD.get_tree_hash()
-LAUNCHER_PUZZLE = load_clsp_relative("clsp/nft_launcher.clsp")
-LAUNCHER_PUZZLE_HASH = LAUNCHER_PUZZLE.get_tree_hash()
+DEFAULT_GAP_LIMIT = 20
+CONFIRMATION_POLL_SECONDS = 1
+CONFIRMATION_TIMEOUT = 600
 
 
-config = load_config(Path(DEFAULT_ROOT_PATH), "config.yaml")
-testnet_agg_sig_data = config["network_overrides"]["constants"]["testnet10"]["AGG_SIG_ME_ADDITIONAL_DATA"]
-DEFAULT_CONSTANTS = DEFAULT_CONSTANTS.replace_str_to_bytes(**{"AGG_SIG_ME_ADDITIONAL_DATA": testnet_agg_sig_data})
+class ConfirmationError(Exception):
+    """A pushed transaction was dropped, reorged out or not confirmed in time"""
+
+
+class PushError(Exception):
+    """The node rejected a bundle of a batch. bundles holds the (tx_id, launcher_ids) already pushed"""
+
+    def __init__(self, message: str, bundles: List[Tuple[bytes32, List[bytes32]]]):
+        super().__init__(message)
+        self.bundles = bundles
+
+
+@lru_cache(maxsize=1)
+def chia_config() -> Dict:
+    return load_config(Path(DEFAULT_ROOT_PATH), "config.yaml")
+
+
+@lru_cache(maxsize=1)
+def network_constants():
+    """DEFAULT_CONSTANTS with testnet10's AGG_SIG_ME data, read from config.yaml the first time it's needed"""
+    testnet_agg_sig_data = chia_config()["network_overrides"]["constants"]["testnet10"]["AGG_SIG_ME_ADDITIONAL_DATA"]
+    return DEFAULT_CONSTANTS.replace_str_to_bytes(**{"AGG_SIG_ME_ADDITIONAL_DATA": testnet_agg_sig_data})
+
+
+def mempool_max_cost() -> int:
+    return int(network_constants().MAX_BLOCK_COST_CLVM * driver.MEMPOOL_COST_LIMIT_FACTOR)
+
+
+# kind -> (derivation from the master key, hidden puzzle hash of the synthetic key)
+KEY_DERIVATIONS = {
+    "nft": (master_sk_to_singleton_owner_sk, lambda: puzzles.INNER_MOD_HASH),
+    "wallet": (master_sk_to_wallet_sk, lambda: DEFAULT_HIDDEN_PUZZLE_HASH),
+    "unhardened": (master_sk_to_wallet_sk_unhardened, lambda: DEFAULT_HIDDEN_PUZZLE_HASH),  # protocol_and_cats_branch
+}
 
 
 class NFTManager:
@@ -64,15 +95,48 @@ class NFTManager:
         wallet_client: WalletRpcClient = None,
         node_client: FullNodeRpcClient = None,
         db_name: str = "nft_store.db",
+        concurrency: int = 16,
+        nft_timeout: float = 30,
+        sync_batch_size: int = 100,
+        gap_limit: int = DEFAULT_GAP_LIMIT,
+        signing_workers: Optional[int] = None,
     ) -> None:
         self.wallet_client = wallet_client
         self.node_client = node_client
         self.db_name = db_name
+        self.concurrency = concurrency
+        self.nft_timeout = nft_timeout
+        self.sync_batch_size = sync_batch_size
+        self.gap_limit = gap_limit
         self.connection = None
+        self.master_sk = None
+        self.nft_pk = None
         self.key_dict = {}
-
-    async def connect(self, wallet_index: int = 0) -> None:
-        config = load_config(Path(DEFAULT_ROOT_PATH), "config.yaml")
+        # pk -> (kind, index, is synthetic) for every cached key, so secret keys can be derived on demand
+        self.key_index: Dict[bytes, Tuple[str, int, bool]] = {}
+        # puzzle hash -> public key for every wallet key that can hold coins
+        self.std_puzzle_hashes: Dict[bytes32, G1Element] = {}
+        self.unhardened_indexes: Dict[bytes32, int] = {}
+        # set when answering from a store kept current by `nft daemon`, without the node or wallet
+        self.daemon_store = False
+        # tx_id -> singleton coin the transaction will create, used to spot inclusion
+        self.expected_children: Dict[bytes32, bytes32] = {}
+        # tx_id -> cost and size of the bundle, as checked before it was signed
+        self.preflight_reports: Dict[bytes32, PreflightReport] = {}
+        # started on the first bundle large enough to sign in parallel, then reused
+        self.signing_workers = signing_workers
+        self.signing_pool: Optional[ProcessPoolExecutor] = None
+
+    async def connect(self, wallet_index: int = 0, read_only: bool = False, sync: bool = True) -> None:
+        """Open the node client and the store, and unless read_only, the wallet and its keys.
+
+        A full connect then syncs the store to the node's peak, unless sync is False. A
+        read-only manager can browse and view NFTs but not sign. It picks up the NFT
+        key from the derived key cache when the store holds a single wallet's keys, and
+        leaves syncing to the query that needs it. Calling connect() again later
+        completes the connection.
+        """
+        config = chia_config()
         rpc_host = config["self_hostname"]
         full_node_rpc_port = config["full_node"]["rpc_port"]
         wallet_rpc_port = config["wallet"]["rpc_port"]
@@ -80,22 +144,79 @@ class NFTManager:
             self.node_client = await FullNodeRpcClient.create(
                 rpc_host, uint16(full_node_rpc_port), Path(DEFAULT_ROOT_PATH), config
             )
+        if not self.connection:
+            self.connection = await aiosqlite.connect(Path(self.db_name))
+            self.db_wrapper = DBWrapper(self.connection)
+            self.nft_wallet = await NFTWallet.create(
+                self.db_wrapper,
+                self.node_client,
+                concurrency=self.concurrency,
+                timeout=self.nft_timeout,
+                batch_size=self.sync_batch_size,
+            )
+        if read_only:
+            self.nft_pk = await self.nft_wallet.get_cached_nft_pk()
+            return
         if not self.wallet_client:
             self.wallet_client = await WalletRpcClient.create(
                 rpc_host, uint16(wallet_rpc_port), Path(DEFAULT_ROOT_PATH), config
             )
+        self.fingerprints = await self.wallet_client.get_public_keys()
+        self.fingerprint = self.fingerprints[wallet_index]
+        await self.load_keys()
+        if sync:
+            await self.nft_wallet.update_to_current_block()
+
+    async def open_store(self) -> bool:
+        """Use the local store directly if a running daemon is keeping it current.
+
+        Returns False, leaving nothing open, when there is no live daemon.
+        """
+        if not Path(self.db_name).exists():
+            return False
         self.connection = await aiosqlite.connect(Path(self.db_name))
         self.db_wrapper = DBWrapper(self.connection)
-        self.nft_wallet = await NFTWallet.create(self.db_wrapper, self.node_client)
-        self.fingerprints = await self.wallet_client.get_public_keys()
-        fp = self.fingerprints[wallet_index]
-        private_key = await self.wallet_client.get_private_key(fp)
-        sk_data = binascii.unhexlify(private_key["sk"])
-        self.master_sk = PrivateKey.from_bytes(sk_data)
-        await self.derive_nft_keys()
-        await self.derive_wallet_keys()
-        await self.derive_unhardened_keys()
-        await self.nft_wallet.update_to_current_block()
+        try:
+            # no DDL here, a migration must not run underneath the daemon
+            self.nft_wallet = await NFTWallet.create(self.db_wrapper, None, read_only=True)
+        except StoreVersionError as e:
+            print(f"Not using the daemon's store: {e}")
+            await self.connection.close()
+            self.connection = None
+            return False
+        heartbeat = await self.nft_wallet.get_live_heartbeat()
+        if heartbeat is None:
+            await self.connection.close()
+            self.connection = None
+            return False
+        _, self.nft_pk, _ = heartbeat
+        self.daemon_store = True
+        return True
+
+    async def run_daemon(self, poll_interval: float = 5) -> None:
+        """Follow new peaks and keep the store current until cancelled"""
+        last_peak = None
+
+        async def heartbeat(height: int):
+            await self.nft_wallet.save_heartbeat(os.getpid(), self.nft_pk, height, poll_interval)
+
+        try:
+            while True:
+                try:
+                    peak = await self.nft_wallet.get_current_height_from_node()
+                    if peak != last_peak:
+                        # readers keep using the store through a long sync instead of all syncing it themselves
+                        await heartbeat(await self.nft_wallet.retrieve_current_block())
+                        await self.nft_wallet.update_to_current_block(on_batch=heartbeat)
+                        last_peak = peak
+                        print(f"Synced to height {peak}")
+                    await self.nft_wallet.save_heartbeat(os.getpid(), self.nft_pk, peak, poll_interval)
+                except Exception as e:
+                    # a node restart or timeout shouldn't take the daemon down, try again next round
+                    print(f"Sync failed: {e}")
+                await asyncio.sleep(poll_interval)
+        finally:
+            await self.nft_wallet.clear_heartbeat()
 
     async def close(self) -> None:
         if self.node_client:
@@ -107,55 +228,129 @@ class NFTManager:
         if self.connection:
             await self.connection.close()
 
+        if self.signing_pool:
+            self.signing_pool.shutdown()
+
     async def sync(self) -> None:
         await self.nft_wallet.basic_sync()
 
-    async def derive_nft_keys(self, index: int = 0) -> None:
-        _sk = master_sk_to_singleton_owner_sk(self.master_sk, index)
-        synth_sk = calculate_synthetic_secret_key(_sk, driver.INNER_MOD.get_tree_hash())
-        self.key_dict[bytes(synth_sk.get_g1())] = synth_sk
-        self.nft_sk = synth_sk
-        self.nft_pk = synth_sk.get_g1()
-
-    async def derive_wallet_keys(self, index=0):
-        _sk = master_sk_to_wallet_sk(self.master_sk, index)
-        synth_sk = calculate_synthetic_secret_key(_sk, DEFAULT_HIDDEN_PUZZLE_HASH)
-        self.key_dict[bytes(synth_sk.get_g1())] = synth_sk
-        self.key_dict[bytes(_sk.get_g1())] = _sk
-        self.wallet_sk = _sk
-
-    async def derive_unhardened_keys(self, n=10):
-        for i in range(n):
-            #_sk = AugSchemeMPL.derive_child_sk_unhardened(self.master_sk, i) #  TESTING on main branch
-            _sk = master_sk_to_wallet_sk_unhardened(self.master_sk, i)  # protocol_and_cats_branch
-            synth_sk = calculate_synthetic_secret_key(_sk, DEFAULT_HIDDEN_PUZZLE_HASH)
+    async def get_master_sk(self) -> PrivateKey:
+        # only fetched from the wallet once something needs a secret key
+        if self.master_sk is None:
+            private_key = await self.wallet_client.get_private_key(self.fingerprint)
+            sk_data = binascii.unhexlify(private_key["sk"])
+            self.master_sk = PrivateKey.from_bytes(sk_data)
+        return self.master_sk
+
+    async def load_keys(self) -> None:
+        """Fill the key maps from the derived key cache, deriving and caching only what is missing"""
+        cached = set()
+        for kind, index, pk, synthetic_pk, puzzle_hash in await self.nft_wallet.get_derived_keys(self.fingerprint):
+            self.add_key(kind, index, pk, synthetic_pk, puzzle_hash)
+            cached.add((kind, index))
+        for kind, count in [("nft", 1), ("wallet", 1), ("unhardened", self.gap_limit)]:
+            missing = [index for index in range(count) if (kind, index) not in cached]
+            if missing:
+                await self.derive_keys(kind, missing)
+        await self.extend_unhardened_keys()
+
+    async def derive_keys(self, kind: str, indexes) -> None:
+        derive, hidden_puzzle_hash = KEY_DERIVATIONS[kind]
+        master_sk = await self.get_master_sk()
+        rows = []
+        for index in indexes:
+            _sk = derive(master_sk, index)
+            synth_sk = calculate_synthetic_secret_key(_sk, hidden_puzzle_hash())
             self.key_dict[bytes(_sk.get_g1())] = _sk
             self.key_dict[bytes(synth_sk.get_g1())] = synth_sk
+            # the nft key never holds standard coins
+            puzzle_hash = None if kind == "nft" else puzzle_for_pk(_sk.get_g1()).get_tree_hash()
+            self.add_key(kind, index, _sk.get_g1(), synth_sk.get_g1(), puzzle_hash)
+            rows.append((kind, index, _sk.get_g1(), synth_sk.get_g1(), puzzle_hash))
+        await self.nft_wallet.save_derived_keys(self.fingerprint, rows)
+
+    def add_key(
+        self, kind: str, index: int, pk: G1Element, synthetic_pk: G1Element, puzzle_hash: Optional[bytes32]
+    ) -> None:
+        self.key_index[bytes(pk)] = (kind, index, False)
+        self.key_index[bytes(synthetic_pk)] = (kind, index, True)
+        if kind == "nft":
+            if index == 0:
+                self.nft_pk = synthetic_pk
+            return
+        self.std_puzzle_hashes[puzzle_hash] = pk
+        if kind == "unhardened":
+            self.unhardened_indexes[puzzle_hash] = index
+
+    async def extend_unhardened_keys(self) -> None:
+        """Derive further unhardened keys until the last gap_limit of them have never held coins"""
+        to_check = list(self.unhardened_indexes.keys())
+        while to_check:
+            records = await self.node_client.get_coin_records_by_puzzle_hashes(to_check, include_spent_coins=True)
+            highest_used = max((self.unhardened_indexes[cr.coin.puzzle_hash] for cr in records), default=-1)
+            derived = len(self.unhardened_indexes)
+            if highest_used + self.gap_limit < derived:
+                break
+            await self.derive_keys("unhardened", range(derived, highest_used + 1 + self.gap_limit))
+            to_check = [ph for ph, index in self.unhardened_indexes.items() if index >= derived]
 
     async def pk_to_sk(self, pk):
-        return self.key_dict.get(bytes(pk))
+        sk = self.key_dict.get(bytes(pk))
+        if sk is None and bytes(pk) in self.key_index:
+            kind, index, synthetic = self.key_index[bytes(pk)]
+            derive, hidden_puzzle_hash = KEY_DERIVATIONS[kind]
+            sk = derive(await self.get_master_sk(), index)
+            if synthetic:
+                sk = calculate_synthetic_secret_key(sk, hidden_puzzle_hash())
+            self.key_dict[bytes(pk)] = sk
+        return sk
+
+    async def preflight(self, coin_spends: List[CoinSpend]) -> PreflightReport:
+        """Validate a bundle locally, then check in one query that the coins it doesn't create are unspent"""
+        report = preflight(coin_spends, mempool_max_cost())
+        spent_ids = {cs.coin.name() for cs in coin_spends}
+        on_chain = [cs.coin.name() for cs in coin_spends if cs.coin.parent_coin_info not in spent_ids]
+        records = await self.node_client.get_coin_records_by_names(on_chain, include_spent_coins=True)
+        unspent = {cr.coin.name() for cr in records if not cr.spent}
+        for coin_id in on_chain:
+            if coin_id not in unspent:
+                raise PreflightError(f"Coin {coin_id.hex()} is already spent or not on chain, the state is stale")
+        return report
+
+    def signing_executor(self) -> ProcessPoolExecutor:
+        """The signing pool, started the first time a bundle has enough signatures to use it"""
+        if self.signing_pool is None:
+            self.signing_pool = ProcessPoolExecutor(self.signing_workers)
+        return self.signing_pool
+
+    async def sign(self, coin_spends: List[CoinSpend]) -> SpendBundle:
+        """Preflight and sign a bundle, keeping its cost report under the bundle's tx_id"""
+        report = await self.preflight(coin_spends)
+        sb = await sign_coin_spends(
+            coin_spends,
+            self.pk_to_sk,
+            network_constants().AGG_SIG_ME_ADDITIONAL_DATA,
+            network_constants().MAX_BLOCK_COST_CLVM,
+            executor_factory=self.signing_executor,
+        )
+        self.preflight_reports[sb.name()] = report
+        return sb
 
     async def available_balance(self) -> int:
         balance_data = await self.wallet_client.get_wallet_balance(1)
         return balance_data["confirmed_wallet_balance"]
 
-    async def choose_std_coin(self, amount: int) -> Tuple[Coin, Program]:
-        # check that wallet_balance is greater than amount
-        assert await self.available_balance() > amount
-        for k in self.key_dict.keys():
-            puzzle = puzzle_for_pk(k)
-            my_coins = await self.node_client.get_coin_records_by_puzzle_hash(
-                puzzle.get_tree_hash(), include_spent_coins=False
-            )
-            if my_coins:
-                coin_record = next((cr for cr in my_coins if (cr.coin.amount >= amount) and (not cr.spent)), None)
-                if coin_record:
-                    assert not coin_record.spent
-                    assert coin_record.coin.puzzle_hash == puzzle.get_tree_hash()
-                    synth_sk = calculate_synthetic_secret_key(self.key_dict[k], DEFAULT_HIDDEN_PUZZLE_HASH)
-                    self.key_dict[bytes(synth_sk.get_g1())] = synth_sk
-                    return (coin_record.coin, puzzle)
-        raise ValueError("No spendable coins found")
+    async def choose_std_coin(
+        self, amount: int, strategy: str = "best_fit", exclude: Set[bytes32] = frozenset()
+    ) -> Tuple[Coin, Program]:
+        selected = await self.choose_std_coins(amount, strategy, max_coins=1, exclude=exclude)
+        return selected[0]
+
+    async def choose_std_coins(
+        self, amount: int, strategy: str = "best_fit", max_coins: int = 1, exclude: Set[bytes32] = frozenset()
+    ) -> List[Tuple[Coin, Program]]:
+        selector = CoinSelector(self.node_client, self.std_puzzle_hashes)
+        return await selector.select(amount, strategy, max_coins, exclude)
 
     async def launch_nft(self, amount: int, nft_data: Tuple, launch_state: List, royalty: List) -> bytes:
         addr = await self.wallet_client.get_next_address(1, False)
@@ -165,46 +360,114 @@ class NFTManager:
 
         found_coin, found_coin_puzzle = await self.choose_std_coin(amount)
 
-        launcher_coin = Coin(found_coin.name(), LAUNCHER_PUZZLE_HASH, amount)
+        launcher_coin = Coin(found_coin.name(), puzzles.LAUNCHER_PUZZLE_HASH, amount)
 
         launcher_spend = driver.make_launcher_spend(found_coin, amount, launch_state, royalty, nft_data)
         found_spend = driver.make_found_spend(found_coin, found_coin_puzzle, launcher_spend, amount)
         eve_spend = driver.make_eve_spend(launch_state, royalty, launcher_spend)
 
-        sb = await sign_coin_spends(
-            [launcher_spend, found_spend, eve_spend],
-            self.pk_to_sk,
-            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
-            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
-        )
+        sb = await self.sign([launcher_spend, found_spend, eve_spend])
 
         res = await self.node_client.push_tx(sb)
         if res["success"]:
             # add launcher_id and pk to nft_coins
             await self.nft_wallet.save_launcher(launcher_coin.name(), self.nft_pk)
-            tx_id = await self.get_tx_from_mempool(sb.name())
+            # the mempool keys items by spend bundle name
+            tx_id = sb.name()
+            self.expected_children[tx_id] = driver.singleton_child(eve_spend).name()
             return (tx_id, launcher_coin.name())
 
-    async def get_tx_from_mempool(self, sb_name):
-        # get mempool txn
-        mempool_items = await self.node_client.get_all_mempool_items()
-        for tx_id in mempool_items.keys():
-            mem_sb_name = bytes32(hexstr_to_bytes(mempool_items[tx_id]["spend_bundle_name"]))
-            if mem_sb_name == sb_name:
-                return tx_id
-        raise ValueError("No tx found in mempool. Check if confirmed")
+    async def launch_nfts(self, launches: List[Tuple[int, Tuple, List, List]]) -> List[Tuple[bytes32, List[bytes32]]]:
+        """Launch many NFTs in as few spend bundles as the mempool cost limit allows.
 
-    async def wait_for_confirmation(self, tx_id, launcher_id):
+        Launches are (amount, nft_data, launch_state, royalty) as for launch_nft. Each bundle chains its
+        launches off one found coin. Every bundle is funded and signed before the first is pushed, so
+        running out of coins or failing preflight pushes nothing. Returns (tx_id, launcher_ids) per
+        bundle, or raises PushError with the bundles already pushed if the node rejects one.
+        """
+        addr = await self.wallet_client.get_next_address(1, False)
+        puzzle_hash = decode_puzzle_hash(addr)
+        max_cost = mempool_max_cost()
+        pending = [
+            (amount, launch_state + [puzzle_hash, self.nft_pk], [puzzle_hash] + royalty, nft_data)
+            for amount, nft_data, launch_state, royalty in launches
+        ]
+
+        signed = []
+        spent_coins = set()
+        while pending:
+            # plan the bundle on the largest coin, then fund it with the best fit for just those launches
+            largest_coin, largest_puzzle = await self.choose_std_coin(
+                pending[0][0], strategy="largest", exclude=spent_coins
+            )
+            spends, launcher_ids, _ = driver.make_launch_chain(largest_coin, largest_puzzle, pending, max_cost)
+            if not launcher_ids:
+                raise ValueError("A single launch exceeds the mempool cost limit")
+            found_coin, found_coin_puzzle = await self.choose_std_coin(
+                sum(launch[0] for launch in pending[: len(launcher_ids)]), exclude=spent_coins
+            )
+            if found_coin != largest_coin:
+                spends, launcher_ids, _ = driver.make_launch_chain(found_coin, found_coin_puzzle, pending, max_cost)
+            signed.append((await self.sign(spends), launcher_ids, spends[-1]))
+            spent_coins.add(found_coin.name())
+            pending = pending[len(launcher_ids) :]
+
+        bundles = []
+        for sb, launcher_ids, last_eve_spend in signed:
+            try:
+                res = await self.node_client.push_tx(sb)
+            except Exception as e:
+                res = {"success": False, "error": e}
+            if not res["success"]:
+                raise PushError(f"Launch bundle {len(bundles) + 1} was rejected: {res.get('error')}", bundles)
+            await self.nft_wallet.save_launchers([(launcher_id, self.nft_pk) for launcher_id in launcher_ids])
+            await self.nft_wallet.db_connection.commit()
+            tx_id = sb.name()
+            # every launch in a bundle confirms together, so the last eve spend's child stands for all
+            self.expected_children[tx_id] = driver.singleton_child(last_eve_spend).name()
+            bundles.append((tx_id, launcher_ids))
+        return bundles
+
+    async def wait_for_confirmation(
+        self, tx_id, launcher_id, timeout: float = CONFIRMATION_TIMEOUT, confirmations: int = 1
+    ) -> NFT:
+        """Wait until the singleton coin created by tx_id is buried under `confirmations` blocks.
+
+        The peak is polled every second and the expected coin is only looked up when
+        the peak moves. Raises ConfirmationError if the transaction leaves the mempool
+        without being included, is reorged out, or the timeout passes.
+        """
+        child_id = self.expected_children[tx_id]
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        last_peak = None
+        included = False
         while True:
-            item = await self.node_client.get_mempool_item_by_tx_id(tx_id)
-            if not item:
-                return await self.nft_wallet.get_nft_by_launcher_id(launcher_id)
-            else:
-                print("Waiting for block (30s)")
-                await asyncio.sleep(30)
+            peak = await self.nft_wallet.get_current_height_from_node()
+            if peak != last_peak:
+                last_peak = peak
+                record = await self.node_client.get_coin_record_by_name(child_id)
+                if record is None and included:
+                    raise ConfirmationError(f"Transaction {tx_id.hex()} was reorged out")
+                if record is None and not await self.node_client.get_mempool_item_by_tx_id(tx_id):
+                    # it may have been included between the two calls
+                    record = await self.node_client.get_coin_record_by_name(child_id)
+                    if record is None:
+                        raise ConfirmationError(f"Transaction {tx_id.hex()} was dropped from the mempool")
+                if record is not None:
+                    included = True
+                    if peak - record.confirmed_block_index + 1 >= confirmations:
+                        del self.expected_children[tx_id]
+                        # walks stop at the synced height, so catch up to the block that confirmed it
+                        await self.nft_wallet.update_to_current_block()
+                        return await self.nft_wallet.get_nft_by_launcher_id(launcher_id)
+                print(f"Waiting for block (height {peak})")
+            if loop.time() > deadline:
+                raise ConfirmationError(f"Transaction {tx_id.hex()} not confirmed after {timeout}s")
+            await asyncio.sleep(CONFIRMATION_POLL_SECONDS)
 
     async def update_nft(self, nft_id: bytes, new_state: List) -> bytes:
-        nft = await self.nft_wallet.get_nft_by_launcher_id(nft_id)
+        nft = (await self.resolve_nfts([bytes32(nft_id)]))[bytes32(nft_id)]
         addr = await self.wallet_client.get_next_address(1, False)
         puzzle_hash = decode_puzzle_hash(addr)
         new_state += [puzzle_hash, self.nft_pk]
@@ -212,56 +475,130 @@ class NFTManager:
         conds = driver.run_singleton(update_spend.puzzle_reveal.to_program(), update_spend.solution.to_program())
         target_pk = conds[-1][1]
 
-        sb = await sign_coin_spends(
-            [update_spend],
-            self.pk_to_sk,
-            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
-            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
-        )
+        sb = await self.sign([update_spend])
         res = await self.node_client.push_tx(sb)
         if res["success"]:
-            tx_id = await self.get_tx_from_mempool(sb.name())
+            # the mempool keys items by spend bundle name
+            tx_id = sb.name()
+            self.expected_children[tx_id] = driver.singleton_child(update_spend).name()
             return tx_id
 
+    async def resolve_nfts(self, launcher_ids: List[bytes32]) -> Dict[bytes32, NFT]:
+        """Current state of each NFT from the synced index, walking only the untracked lineages"""
+        await self.nft_wallet.update_to_current_block()
+        nfts = {nft.launcher_id: nft for nft in await self.nft_wallet.get_indexed_nfts(launcher_ids)}
+        missing = [launcher_id for launcher_id in launcher_ids if launcher_id not in nfts]
+        if missing:
+            nfts.update({nft.launcher_id: nft for nft in await self.nft_wallet.get_nfts_by_launcher_ids(missing)})
+        return nfts
+
+    async def update_nfts(self, updates: List[Tuple[bytes32, List]]) -> List[Tuple[bytes32, List[bytes32]]]:
+        """Update many owned NFTs with one aggregate signature and a single push.
+
+        Updates are (launcher_id, new_state) with new_state as for update_nft. The spends are built from
+        the local index, and only split over several bundles if together they exceed the mempool cost
+        limit. Every bundle is preflighted and signed before the first is pushed. Returns (tx_id,
+        launcher_ids) per bundle, or raises PushError with the bundles already pushed if the node rejects one.
+        """
+        nfts = await self.resolve_nfts([launcher_id for launcher_id, _ in updates])
+        for launcher_id, _ in updates:
+            if launcher_id not in nfts or nfts[launcher_id].owner_pk() != bytes(self.nft_pk):
+                raise ValueError(f"NFT {launcher_id.hex()} is not one of yours")
+
+        addr = await self.wallet_client.get_next_address(1, False)
+        puzzle_hash = decode_puzzle_hash(addr)
+        max_cost = mempool_max_cost()
+        batches = [([], [])]
+        batch_cost = 0
+        for launcher_id, new_state in updates:
+            update_spend = driver.make_update_spend(nfts[launcher_id], new_state + [puzzle_hash, self.nft_pk])
+            cost = driver.spend_cost(update_spend)
+            if batch_cost + cost > max_cost and batches[-1][0]:
+                batches.append(([], []))
+                batch_cost = 0
+            batches[-1][0].append(update_spend)
+            batches[-1][1].append(launcher_id)
+            batch_cost += cost
+
+        signed = [(await self.sign(spends), ids, spends[-1]) for spends, ids in batches]
+        bundles = []
+        for sb, ids, last_spend in signed:
+            try:
+                res = await self.node_client.push_tx(sb)
+            except Exception as e:
+                res = {"success": False, "error": e}
+            if not res["success"]:
+                raise PushError(f"Update bundle {len(bundles) + 1} was rejected: {res.get('error')}", bundles)
+            tx_id = sb.name()
+            self.expected_children[tx_id] = driver.singleton_child(last_spend).name()
+            bundles.append((tx_id, ids))
+        return bundles
+
     async def get_my_nfts(self) -> List[NFT]:
-        launcher_ids = await self.nft_wallet.get_all_nft_ids()
-        my_nfts = []
-        for launcher_id in launcher_ids:
-            nft = await self.nft_wallet.get_nft_by_launcher_id(launcher_id)
-            if nft.owner_pk() == bytes(self.nft_pk):
-                my_nfts.append(nft)
-        return my_nfts
+        if not self.daemon_store:
+            await self.nft_wallet.update_to_current_block()
+        return await self.nft_wallet.get_indexed_nfts_by_owner(self.nft_pk)
 
     async def get_for_sale_nfts(self) -> List[NFT]:
-        launcher_ids = await self.nft_wallet.get_all_nft_ids()
-        for_sale_nfts = []
-        for launcher_id in launcher_ids:
-            nft = await self.nft_wallet.get_nft_by_launcher_id(launcher_id)
-            if (nft.is_for_sale()) and (nft.owner_pk() != bytes(self.nft_pk)):
-                for_sale_nfts.append(nft)
-        return for_sale_nfts
+        if not self.daemon_store:
+            await self.nft_wallet.update_to_current_block()
+        return await self.nft_wallet.get_indexed_for_sale_nfts(exclude_pk=self.nft_pk)
 
     async def buy_nft(self, launcher_id: bytes, new_state: List) -> bytes:
-        nft = await self.nft_wallet.get_nft_by_launcher_id(launcher_id)
+        launcher_id = bytes32(launcher_id)
+        nft = (await self.resolve_nfts([launcher_id])).get(launcher_id)
+        if nft is None or not nft.is_for_sale():
+            raise ValueError(f"NFT {launcher_id.hex()} is not for sale")
         addr = await self.wallet_client.get_next_address(1, False)
         ph = decode_puzzle_hash(addr)
         new_state += [ph, self.nft_pk]
         payment_coin, payment_coin_puzzle = await self.choose_std_coin(nft.price())
         nft_spend, p2_spend, payment_spend = driver.make_buy_spend(nft, new_state, payment_coin, payment_coin_puzzle)
 
-        sb = await sign_coin_spends(
-            [nft_spend, p2_spend, payment_spend],
-            self.pk_to_sk,
-            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
-            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+        sb = await self.sign([nft_spend, p2_spend, payment_spend])
+        res = await self.node_client.push_tx(sb)
+        if res["success"]:
+            # the mempool keys items by spend bundle name
+            tx_id = sb.name()
+            self.expected_children[tx_id] = driver.singleton_child(nft_spend).name()
+            return tx_id
+
+    async def sweep_buy_nfts(self, purchases: List[Tuple[bytes32, List]], max_coins: int = 10) -> bytes32:
+        """Buy several listings in one atomic spend bundle.
+
+        Purchases are (launcher_id, new_state) as for buy_nft. Up to max_coins distinct funding coins
+        are selected for the combined price, so no coin is used twice. Raises ValueError if a listing
+        isn't for sale, and PreflightError if the bundle would exceed the mempool cost limit.
+        """
+        nfts = await self.resolve_nfts([launcher_id for launcher_id, _ in purchases])
+        for launcher_id, _ in purchases:
+            if launcher_id not in nfts or not nfts[launcher_id].is_for_sale():
+                raise ValueError(f"NFT {launcher_id.hex()} is not for sale")
+        addr = await self.wallet_client.get_next_address(1, False)
+        ph = decode_puzzle_hash(addr)
+        payment_coins = await self.choose_std_coins(
+            sum(nfts[launcher_id].price() for launcher_id, _ in purchases), max_coins=max_coins
         )
+        spends = driver.make_sweep_buy_spends(
+            [(nfts[launcher_id], new_state + [ph, self.nft_pk]) for launcher_id, new_state in purchases],
+            payment_coins,
+        )
+
+        sb = await self.sign(spends)
         res = await self.node_client.push_tx(sb)
         if res["success"]:
-            tx_id = await self.get_tx_from_mempool(sb.name())
+            tx_id = sb.name()
+            # the first spend is the first purchased singleton
+            self.expected_children[tx_id] = driver.singleton_child(spends[0]).name()
             return tx_id
 
     async def view_nft(self, launcher_id: bytes) -> NFT:
-        nft = await self.nft_wallet.get_nft_by_launcher_id(launcher_id)
+        if not self.daemon_store:
+            await self.nft_wallet.update_to_current_block()
+        nft = await self.nft_wallet.get_indexed_nft(launcher_id)
+        if not nft and not self.daemon_store:
+            # not one of the launchers we track, look it up on chain
+            nft = await self.nft_wallet.get_nft_by_launcher_id(launcher_id)
         return nft
 
 
@@ -1,73 +1,203 @@
+import asyncio
 import logging
-from typing import List, Tuple, Dict, Optional
+import time
+from typing import Awaitable, Callable, List, Tuple, Dict, Optional
 from blspy import AugSchemeMPL, G1Element, G2Element, PrivateKey
 import aiosqlite
 
+from chia.consensus.block_record import BlockRecord
 from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program
 from chia.types.coin_spend import CoinSpend
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.util.db_wrapper import DBWrapper
-from chia.util.ints import uint32
-from chia.wallet.puzzles.load_clvm import load_clvm
+from chia.util.ints import uint32, uint64
+from chia.wallet.lineage_proof import LineageProof
 from clvm.casts import int_to_bytes, int_from_bytes
 
-from sim import load_clsp_relative
+import puzzles
 
 
 log = logging.getLogger(__name__)
 
-SINGLETON_MOD = load_clvm("singleton_top_layer.clvm")
-SINGLETON_MOD_HASH = SINGLETON_MOD.get_tree_hash()
-LAUNCHER_PUZZLE = load_clsp_relative("clsp/nft_launcher.clsp")
-LAUNCHER_PUZZLE_HASH = LAUNCHER_PUZZLE.get_tree_hash()
+STORE_VERSION = 2
+SQLITE_MAX_VARIABLES = 900
+SYNC_BATCH_BLOCKS = 100
+FORK_SEARCH_WINDOW = 32
+CHECKPOINT_DEPTH = 1000
+SQLITE_CACHE_KB = 64 * 1024
+# a daemon heartbeat older than this many poll intervals (and HEARTBEAT_MIN_AGE seconds) is stale
+HEARTBEAT_MISSES = 3
+HEARTBEAT_MIN_AGE = 30
+
+
+def chunks(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def coin_to_bytes(coin: Coin) -> bytes:
+    # Coin refuses bytes() since its hashed and streamed forms differ, so use the streamed layout directly
+    return bytes(coin.parent_coin_info) + bytes(coin.puzzle_hash) + uint64(coin.amount).to_bytes(8, "big")
+
+
+def coin_from_bytes(blob: bytes) -> Coin:
+    return Coin(bytes32(blob[:32]), bytes32(blob[32:64]), uint64(int.from_bytes(blob[64:72], "big")))
+
+
+class StoreVersionError(Exception):
+    """The store on disk has a different layout version than this code"""
+
+
+class NFT:
+    """The current coin of a CreatorNFT singleton, with its state decoded once.
+
+    Only what display and the spend drivers need is kept: the coin, the state
+    and royalty curried into its inner puzzle, the hash of that puzzle's mod,
+    the launch data and the lineage proof for spending it.
+    """
+
+    __slots__ = (
+        "launcher_id",
+        "parent_coin_info",
+        "puzzle_hash",
+        "amount",
+        "data",
+        "royalty",
+        "mod_hash",
+        "lineage_proof",
+        "_state",
+        "_name",
+    )
+
+    def __init__(self, launcher_id: bytes32, coin: Coin, last_spend: CoinSpend, nft_data=None, royalty=None):
+        _, args = last_spend.puzzle_reveal.to_program().uncurry()
+        _, inner_puzzle = list(args.as_iter())
+        # every creator NFT inner puzzle curries in (MOD_HASH STATE ROYALTY)
+        _, inner_args = inner_puzzle.uncurry()
+        mod_hash = inner_args.first().as_atom()
+        if mod_hash in puzzles.inner_mod_hashes():
+            # the mod was checked when the NFT was found and every spend recreates it, so
+            # only the curried arguments need hashing
+            arg_hashes = [arg.get_tree_hash() for arg in inner_args.as_iter()]
+            inner_puzzle_hash = puzzles.curried_tree_hash(mod_hash, *arg_hashes)
+        else:
+            inner_puzzle_hash = inner_puzzle.get_tree_hash()
+        if royalty is None:
+            royalty = inner_args.rest().rest().first()
+        # the singleton solution is (lineage_proof amount inner_solution), new_state leads the inner solution
+        state = last_spend.solution.to_program().rest().rest().first().first()
+        self._set(
+            launcher_id,
+            coin,
+            Program.to(nft_data).as_python(),
+            Program.to(royalty).as_python(),
+            mod_hash,
+            LineageProof(last_spend.coin.parent_coin_info, inner_puzzle_hash, last_spend.coin.amount),
+            state.as_python(),
+        )
 
-INNER_MOD = load_clsp_relative("clsp/creator_nft.clsp")
-P2_MOD = load_clsp_relative("clsp/p2_creator_nft.clsp")
+    def _set(self, launcher_id, coin, data, royalty, mod_hash, lineage_proof, state):
+        setattr_ = object.__setattr__
+        setattr_(self, "launcher_id", bytes32(launcher_id))
+        setattr_(self, "parent_coin_info", coin.parent_coin_info)
+        setattr_(self, "puzzle_hash", coin.puzzle_hash)
+        setattr_(self, "amount", coin.amount)
+        setattr_(self, "data", data)
+        setattr_(self, "royalty", royalty)
+        setattr_(self, "mod_hash", bytes32(mod_hash))
+        setattr_(self, "lineage_proof", lineage_proof)
+        setattr_(self, "_state", tuple(state))
+        setattr_(self, "_name", coin.name())
 
+    def __setattr__(self, name, value):
+        raise AttributeError(f"NFT is immutable, can't set {name}")
 
-class NFT(Coin):
-    def __init__(self, launcher_id: bytes32, coin: Coin, last_spend: CoinSpend = None, nft_data=None, royalty=None):
-        super().__init__(coin.parent_coin_info, coin.puzzle_hash, coin.amount)
-        self.launcher_id = launcher_id
-        self.last_spend = last_spend
-        self.data = nft_data
-        self.royalty = royalty
+    def __repr__(self) -> str:
+        return f"NFT(launcher_id={self.launcher_id.hex()}, coin={self._name.hex()})"
 
-    def conditions(self):
-        if self.last_spend:
-            return conditions_dict_for_solution(
-                self.last_spend.puzzle_reveal.to_program(), self.last_spend.solution.to_program()
-            )
+    def name(self) -> bytes32:
+        return self._name
 
     def as_coin(self):
         return Coin(self.parent_coin_info, self.puzzle_hash, self.amount)
 
     def state(self):
-        mod, args = self.last_spend.solution.to_program().uncurry()
-        return mod.as_python()[-1][0]
-
-    # def royalty(self):
-    #     mod, args = self.last_spend.solution.to_program().uncurry()
-    #     return mod.as_python()[0]
+        return list(self._state)
 
     def is_for_sale(self):
-        if int_from_bytes(self.state()[0]) != 0:
-            return True
+        return int_from_bytes(self._state[0]) != 0
 
     def royalty_pc(self):
         return int_from_bytes(self.royalty[1])
 
     def owner_pk(self):
-        return self.state()[-1]
+        return self._state[-1]
 
     def owner_fingerprint(self):
         return G1Element(self.owner_pk()).get_fingerprint()
 
     def owner_puzzle_hash(self):
-        return self.state()[-2]
+        return self._state[-2]
 
     def price(self):
-        return int_from_bytes(self.state()[1])
+        return int_from_bytes(self._state[1])
+
+    def creator_puzzle_hash(self):
+        return self.royalty[0]
+
+    def to_bytes(self) -> bytes:
+        proof = self.lineage_proof
+        return bytes(
+            Program.to(
+                [
+                    self.launcher_id,
+                    coin_to_bytes(self),
+                    list(self._state),
+                    self.royalty,
+                    self.data,
+                    self.mod_hash,
+                    [proof.parent_name, proof.inner_puzzle_hash, proof.amount],
+                ]
+            )
+        )
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "NFT":
+        launcher_id, coin, state, royalty, nft_data, mod_hash, proof = Program.from_bytes(blob).as_iter()
+        parent_name, inner_puzzle_hash, amount = proof.as_iter()
+        nft = cls.__new__(cls)
+        nft._set(
+            launcher_id.as_atom(),
+            coin_from_bytes(coin.as_atom()),
+            nft_data.as_python(),
+            royalty.as_python(),
+            mod_hash.as_atom(),
+            LineageProof(bytes32(parent_name.as_atom()), bytes32(inner_puzzle_hash.as_atom()), uint64(amount.as_int())),
+            state.as_python(),
+        )
+        return nft
+
+
+def make_nft(launcher_id: bytes32, coin: Coin, last_spend: CoinSpend, launcher_spend: CoinSpend) -> NFT:
+    # key_value_list is the last argument of the launcher solution
+    nft_data = list(launcher_spend.solution.to_program().as_iter())[-1]
+    return NFT(launcher_id, coin, last_spend, nft_data)
+
+
+def next_singleton_coin(last_spend: CoinSpend, next_coin_records: List) -> Coin:
+    """Pick the recreated singleton out of the coins created by last_spend"""
+    if len(next_coin_records) == 3:
+        # last spend was purchase spend, so separate out the puzzlehashes
+        _, args = last_spend.puzzle_reveal.to_program().uncurry()
+        _, inner_puzzle = list(args.as_iter())
+        _, inner_args = inner_puzzle.uncurry()
+        state = inner_args.rest().first().as_python()
+        royalty = inner_args.rest().rest().first().as_python()
+        for rec in next_coin_records:
+            if rec.coin.puzzle_hash not in [state[2], royalty[0]]:
+                return rec.coin
+    return next_coin_records[0].coin
 
 
 class NFTWallet:
@@ -76,20 +206,70 @@ class NFTWallet:
     _state_transitions_cache: Dict[int, List[Tuple[uint32, CoinSpend]]]
 
     @classmethod
-    async def create(cls, wrapper: DBWrapper, node_client):
+    async def create(
+        cls,
+        wrapper: DBWrapper,
+        node_client,
+        concurrency: int = 16,
+        timeout: float = 30,
+        batch_size: int = SYNC_BATCH_BLOCKS,
+        read_only: bool = False,
+    ):
+        """Open the store, creating or migrating its tables.
+
+        With read_only nothing is created or dropped, so a reader can share the store with a
+        running daemon. It raises StoreVersionError unless the store is at STORE_VERSION.
+        """
         self = cls()
 
         self.db_connection = wrapper.db
         self.db_wrapper = wrapper
         self.node_client = node_client
+        # limits on the node requests made for individual NFTs
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        # blocks applied, and committed, per sync transaction
+        self.batch_size = batch_size
+
+        await self.db_connection.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        if read_only:
+            cursor = await self.db_connection.execute("PRAGMA user_version")
+            version = (await cursor.fetchone())[0]
+            await cursor.close()
+            if version != STORE_VERSION:
+                raise StoreVersionError(f"Store is at version {version}, expected {STORE_VERSION}")
+            return self
+
+        # writes are committed once per sync batch, so WAL with NORMAL sync is safe and avoids an fsync per commit
+        await self.db_connection.execute("PRAGMA journal_mode=WAL")
+        await self.db_connection.execute("PRAGMA synchronous=NORMAL")
+
+        # earlier versions created this table with a per-wallet layout but never wrote to it
+        cursor = await self.db_connection.execute("PRAGMA table_info(nft_state_transitions)")
+        columns = [row[1] for row in await cursor.fetchall()]
+        await cursor.close()
+        if columns and "launcher_id" not in columns:
+            await self.db_connection.execute("DROP TABLE nft_state_transitions")
 
+        # nft_state rows hold serialized NFTs; when their layout changes the table is dropped and
+        # rebuilt from the stored transitions by the next sync, since every launcher is then unindexed
+        cursor = await self.db_connection.execute("PRAGMA user_version")
+        version = (await cursor.fetchone())[0]
+        await cursor.close()
+        if version < STORE_VERSION:
+            await self.db_connection.execute("DROP TABLE IF EXISTS nft_state")
+            await self.db_connection.execute(f"PRAGMA user_version = {STORE_VERSION}")
+
+        # one row per spend in a singleton's lineage. Index 0 is the launcher spend,
+        # next_coin is the singleton coin created by the spend.
         await self.db_connection.execute(
             """CREATE TABLE IF NOT EXISTS
-                 nft_state_transitions(transition_index integer,
-                                       wallet_id integer,
+                 nft_state_transitions(launcher_id blob,
+                                       transition_index integer,
                                        height bigint,
                                        coin_spend blob,
-                                       PRIMARY KEY(transition_index, wallet_id))"""
+                                       next_coin blob,
+                                       PRIMARY KEY(launcher_id, transition_index))"""
         )
 
         await self.db_connection.execute(
@@ -103,6 +283,57 @@ class NFTWallet:
                  height (block integer)"""
         )
 
+        # header hash of every block applied by sync, used to find the fork point after a reorg
+        await self.db_connection.execute(
+            """CREATE TABLE IF NOT EXISTS
+                 sync_checkpoints (height integer PRIMARY KEY,
+                                   header_hash blob)"""
+        )
+
+        # current state of every known NFT, kept up to date by sync
+        await self.db_connection.execute(
+            """CREATE TABLE IF NOT EXISTS
+                 nft_state (launcher_id blob PRIMARY KEY,
+                            coin_id blob,
+                            for_sale integer,
+                            price bigint,
+                            owner_puzzle_hash blob,
+                            owner_pk blob,
+                            royalty_pc integer,
+                            creator_puzzle_hash blob,
+                            height bigint,
+                            nft blob)"""
+        )
+        await self.db_connection.execute("CREATE INDEX IF NOT EXISTS nft_state_for_sale on nft_state(for_sale, price)")
+        await self.db_connection.execute("CREATE INDEX IF NOT EXISTS nft_state_owner_pk on nft_state(owner_pk)")
+        await self.db_connection.execute(
+            "CREATE INDEX IF NOT EXISTS nft_state_creator on nft_state(creator_puzzle_hash)"
+        )
+
+        # public keys and puzzle hashes derived from each wallet fingerprint, so secret keys
+        # only need deriving when something is signed
+        await self.db_connection.execute(
+            """CREATE TABLE IF NOT EXISTS
+                 derived_keys (fingerprint integer,
+                               kind text,
+                               idx integer,
+                               pk blob,
+                               synthetic_pk blob,
+                               puzzle_hash blob,
+                               PRIMARY KEY(fingerprint, kind, idx))"""
+        )
+
+        # single row written by `nft daemon` so other processes know the store is being kept current
+        await self.db_connection.execute(
+            """CREATE TABLE IF NOT EXISTS
+                 daemon_heartbeat (id integer PRIMARY KEY CHECK (id = 0),
+                                   pid integer,
+                                   owner_pk blob,
+                                   peak integer,
+                                   poll_interval real,
+                                   updated_at real)"""
+        )
+
         await self.db_connection.commit()
 
         return self
@@ -110,6 +341,12 @@ class NFTWallet:
     async def _clear_database(self):
         cursor = await self.db_connection.execute("DELETE FROM nft_coins")
         await cursor.close()
+        cursor = await self.db_connection.execute("DELETE FROM nft_state_transitions")
+        await cursor.close()
+        cursor = await self.db_connection.execute("DELETE FROM nft_state")
+        await cursor.close()
+        cursor = await self.db_connection.execute("DELETE FROM sync_checkpoints")
+        await cursor.close()
         await self.db_connection.commit()
 
     async def get_current_height_from_node(self):
@@ -120,7 +357,6 @@ class NFTWallet:
     async def set_new_height(self, new_height: int):
         cursor = await self.db_connection.execute("INSERT OR REPLACE INTO height (block) VALUES (?)", (new_height,))
         await cursor.close()
-        await self.db_connection.commit()
 
     async def retrieve_current_block(self):
         current_block = None
@@ -137,34 +373,171 @@ class NFTWallet:
 
         return current_block
 
-    async def update_to_current_block(self):
-        current_block = await self.retrieve_current_block()
-        new_height = await self.get_current_height_from_node()
-        if new_height - 1 < current_block:
-            current_block = max(new_height - 1, 1)
+    async def save_checkpoints(self, block_records: List[BlockRecord]):
+        await self.db_connection.executemany(
+            "INSERT OR REPLACE INTO sync_checkpoints (height, header_hash) VALUES (?, ?)",
+            [(r.height, bytes(r.header_hash)) for r in block_records],
+        )
+        # a reorg deeper than this is not something we try to recover from
+        cursor = await self.db_connection.execute(
+            "DELETE FROM sync_checkpoints WHERE height < (SELECT MAX(height) FROM sync_checkpoints) - ?",
+            (CHECKPOINT_DEPTH,),
+        )
+        await cursor.close()
 
-        if current_block is None:
-            current_block = await self.get_current_height_from_node()
-            current_block -= 1
+    async def find_fork_point(self) -> Optional[int]:
+        """Return the highest checkpoint that is still on the node's chain.
 
-        singletons = await self.node_client.get_coin_records_by_puzzle_hash(
-            LAUNCHER_PUZZLE_HASH, start_height=current_block, end_height=new_height
+        None means there are no checkpoints to compare against. If none of the
+        checkpoints match, the height below the oldest one is returned.
+        """
+        cursor = await self.db_connection.execute(
+            "SELECT height, header_hash FROM sync_checkpoints ORDER BY height DESC"
         )
-        await self.filter_singletons(singletons)
+        checkpoints = [(row[0], bytes32(row[1])) for row in await cursor.fetchall()]
+        await cursor.close()
+        if not checkpoints:
+            return None
+
+        top_height, top_hash = checkpoints[0]
+        top_record = await self.node_client.get_block_record_by_height(top_height)
+        if top_record is not None and top_record.header_hash == top_hash:
+            return top_height
+
+        # walk back through the checkpoints a window at a time until the hashes agree
+        for window in chunks(checkpoints, FORK_SEARCH_WINDOW):
+            low, high = window[-1][0], window[0][0]
+            on_chain = {
+                r.height: r.header_hash
+                for r in map(BlockRecord.from_json_dict, await self.node_client.get_block_records(low, high + 1))
+            }
+            for height, header_hash in window:
+                if on_chain.get(height) == header_hash:
+                    return height
+        return checkpoints[-1][0] - 1
+
+    async def rollback_to(self, fork_height: int):
+        """Undo every transition above fork_height and restore the indexed state from what remains"""
+        cursor = await self.db_connection.execute(
+            "SELECT DISTINCT launcher_id FROM nft_state_transitions WHERE height > ?", (fork_height,)
+        )
+        affected = [bytes32(row[0]) for row in await cursor.fetchall()]
+        await cursor.close()
+        log.warning(f"Reorg: rolling back {len(affected)} NFTs to height {fork_height}")
+
+        for table, column in [("nft_state_transitions", "height"), ("sync_checkpoints", "height"), ("height", "block")]:
+            cursor = await self.db_connection.execute(f"DELETE FROM {table} WHERE {column} > ?", (fork_height,))
+            await cursor.close()
+
+        latest = await self.get_latest_transitions(affected)
+        launcher_spends = await self.get_transitions(affected, 0)
+        restored = []
+        for launcher_id in affected:
+            if launcher_id in latest and latest[launcher_id][0] >= 1:
+                index, height, last_spend, coin = latest[launcher_id]
+                restored.append((make_nft(launcher_id, coin, last_spend, launcher_spends[launcher_id]), height))
+            else:
+                # the launch itself was reorged out
+                cursor = await self.db_connection.execute(
+                    "DELETE FROM nft_state WHERE launcher_id = ?", (bytes(launcher_id),)
+                )
+                await cursor.close()
+        await self.save_nfts(restored)
+        await self.set_new_height(fork_height)
+        await self.db_connection.commit()
 
+    async def update_to_current_block(self, on_batch: Optional[Callable[[int], Awaitable]] = None):
+        """Sync the store to the node's peak. on_batch is awaited with the height after every committed batch."""
+        current_block = await self.retrieve_current_block()
+        new_height = await self.get_current_height_from_node()
+
+        fork_height = await self.find_fork_point()
+        if fork_height is not None and fork_height < current_block:
+            await self.rollback_to(fork_height)
+            current_block = fork_height
+        if new_height < current_block:
+            current_block = new_height
+        if fork_height is None:
+            # first sync of this store, anchor the walks below so a later reorg under them is noticed
+            record = await self.node_client.get_block_record_by_height(current_block)
+            if record is not None:
+                await self.save_checkpoints([record])
+
+        # launchers found by basic_sync or launched by us that haven't been resolved yet
+        unindexed = await self.get_unindexed_nft_ids()
+        if unindexed:
+            await self.get_nfts_by_launcher_ids(unindexed, max_height=current_block)
+
+        tracked = await self.get_tracked_coins()
         while new_height > current_block:
-            if new_height - current_block > 1:
-                new_height = current_block + 1
+            end = min(current_block + 1 + self.batch_size, new_height + 1)
+            await self.sync_blocks(current_block + 1, end, tracked)
+            current_block = end - 1
+            await self.set_new_height(current_block)
+            # everything a batch wrote lands in one transaction
+            await self.db_connection.commit()
+            if on_batch is not None:
+                await on_batch(current_block)
+
+    async def sync_blocks(self, start: int, end: int, tracked: Dict[bytes32, bytes32]):
+        """Apply the blocks in [start, end) to the tracked NFTs.
+
+        tracked maps the current coin id of each NFT to its launcher id and is
+        updated in place as NFTs move.
+        """
+        all_records = [BlockRecord.from_json_dict(r) for r in await self.node_client.get_block_records(start, end)]
+        block_records = sorted((r for r in all_records if r.is_transaction_block), key=lambda r: r.height)
+
+        async def additions_and_removals(header_hash: bytes32):
+            async with self.semaphore:
+                return await self.node_client.get_additions_and_removals(header_hash)
+
+        blocks = await asyncio.gather(*[additions_and_removals(r.header_hash) for r in block_records])
+
+        new_launchers = []
+        moved: Dict[bytes32, Tuple[int, CoinSpend, Coin]] = {}
+        transitions = []
+        indexes: Dict[bytes32, int] = {}
+        for record, (additions, removals) in zip(block_records, blocks):
+            new_launchers += [cr for cr in additions if cr.coin.puzzle_hash == puzzles.LAUNCHER_PUZZLE_HASH]
+            for removal in removals:
+                coin_id = removal.coin.name()
+                if coin_id not in tracked:
+                    continue
+                # only spends of tracked singletons are fetched and decoded
+                launcher_id = tracked.pop(coin_id)
+                last_spend = await self.node_client.get_puzzle_and_solution(coin_id, record.height)
+                children = [cr for cr in additions if cr.coin.parent_coin_info == coin_id]
+                next_coin = next_singleton_coin(last_spend, children)
+                if launcher_id not in indexes:
+                    indexes[launcher_id] = await self.get_latest_transition_index(launcher_id)
+                indexes[launcher_id] += 1
+                transitions.append((launcher_id, indexes[launcher_id], record.height, last_spend, next_coin))
+                tracked[next_coin.name()] = launcher_id
+                moved[launcher_id] = (record.height, last_spend, next_coin)
+
+        await self.save_transitions(transitions)
+        if moved:
+            launcher_spends = await self.get_transitions(list(moved.keys()), 0)
+            await self.save_nfts(
+                [
+                    (make_nft(launcher_id, coin, last_spend, launcher_spends[launcher_id]), height)
+                    for launcher_id, (height, last_spend, coin) in moved.items()
+                ]
+            )
 
-            # ADD FUNCTIONS TO UPDATE SINGLE STATES HERE
+        if new_launchers:
+            # only the launchers of creator NFTs are resolved, other singletons are never walked or indexed
+            launcher_ids = await self.filter_singletons(new_launchers, commit=False)
+            for nft in await self.get_nfts_by_launcher_ids(launcher_ids, commit=False, max_height=end - 1):
+                tracked[nft.name()] = nft.launcher_id
 
-            await self.set_new_height(new_height)
-            current_block = new_height
-            blockchain_state = await self.node_client.get_blockchain_state()
-            new_height = blockchain_state["peak"].height
+        await self.save_checkpoints(all_records)
 
-    async def filter_singletons(self, singletons: List):
+    async def filter_singletons(self, singletons: List, commit: bool = True) -> List[bytes32]:
+        """Save the launchers whose eve spend runs a creator NFT inner puzzle, and return their ids"""
         print(f"Updating {len(singletons)} CreatorNFTs")
+        launchers = []
         for cr in singletons:
             eve_cr = await self.node_client.get_coin_records_by_parent_ids([cr.coin.name()])
             assert len(eve_cr) > 0
@@ -176,74 +549,314 @@ class NFTWallet:
                 _, args = eve_spend.puzzle_reveal.to_program().uncurry()
                 _, inner_puzzle = list(args.as_iter())
                 mod, _ = inner_puzzle.uncurry()
-                if mod.get_tree_hash() == INNER_MOD.get_tree_hash():
+                if mod.get_tree_hash() in puzzles.inner_mod_hashes():
                     mod, _ = eve_spend.solution.to_program().uncurry()
                     state = mod.as_python()[-1][0]
-                    await self.save_launcher(cr.coin.name(), state[-1])
+                    launchers.append((cr.coin.name(), state[-1]))
+        await self.save_launchers(launchers)
+        if commit:
+            await self.db_connection.commit()
+        return [launcher_id for launcher_id, _ in launchers]
 
     async def get_nft_by_launcher_id(self, launcher_id: bytes32):
-        nft_id = launcher_id
-        launcher_rec = await self.node_client.get_coin_record_by_name(launcher_id)
-        launcher_spend = await self.node_client.get_puzzle_and_solution(
-            launcher_rec.coin.name(), launcher_rec.spent_block_index
+        nfts = await self.get_nfts_by_launcher_ids([launcher_id])
+        if nfts:
+            return nfts[0]
+
+    async def get_nfts_by_launcher_ids(
+        self, launcher_ids: List[bytes32], commit: bool = True, max_height: Optional[int] = None
+    ) -> List[NFT]:
+        """Advance every requested lineage to its unspent coin, one hop per round.
+
+        Each round makes a single get_coin_records_by_parent_ids call for all coins at
+        the head of a lineage, so the number of rounds is set by the longest history
+        rather than the total number of hops.
+
+        Walks stop at max_height (the synced height by default) so every transition
+        they record is below a sync checkpoint and is rolled back on a reorg. Later
+        spends are picked up by sync_blocks. If a round's child lookup fails, the walk
+        ends at the heads reached so far instead of raising.
+        """
+        launcher_ids = [bytes32(launcher_id) for launcher_id in launcher_ids]
+        if max_height is None:
+            max_height = await self.retrieve_current_block()
+        latest = await self.get_latest_transitions(launcher_ids)
+
+        # launcher_id -> (transition_index, height, last_spend, coin at the head of the lineage)
+        frontier: Dict[bytes32, Tuple[int, int, Optional[CoinSpend], Coin]] = {}
+        for launcher_id, (index, height, last_spend, next_coin) in latest.items():
+            frontier[launcher_id] = (index, height, last_spend, next_coin)
+        unknown = [launcher_id for launcher_id in launcher_ids if launcher_id not in latest]
+        if unknown:
+            # nothing stored yet, walk from the launcher coins themselves
+            for launcher_rec in await self.node_client.get_coin_records_by_names(unknown):
+                if launcher_rec.confirmed_block_index > max_height:
+                    continue
+                frontier[launcher_rec.coin.name()] = (-1, launcher_rec.confirmed_block_index, None, launcher_rec.coin)
+
+        heads: Dict[bytes32, Tuple[int, int, Optional[CoinSpend], Coin]] = {}
+        while frontier:
+            coin_ids = [coin.name() for _, _, _, coin in frontier.values()]
+            try:
+                records = await self.limited(self.node_client.get_coin_records_by_parent_ids(coin_ids))
+            except Exception as e:
+                # keep what was walked so far, sync_blocks carries these lineages on from their heads
+                log.warning(f"Stopping lineage walk of {len(frontier)} NFTs: could not fetch children: {e}")
+                heads.update(frontier)
+                break
+            children: Dict[bytes32, List] = {}
+            for rec in records:
+                children.setdefault(rec.coin.parent_coin_info, []).append(rec)
+
+            spent = {}
+            for launcher_id, (index, height, last_spend, coin) in frontier.items():
+                if coin.name() in children and children[coin.name()][0].confirmed_block_index <= max_height:
+                    spent[launcher_id] = (index, coin, children[coin.name()])
+                else:
+                    heads[launcher_id] = (index, height, last_spend, coin)
+
+            spends = await asyncio.gather(
+                *[
+                    self.limited(self.node_client.get_puzzle_and_solution(coin.name(), recs[0].confirmed_block_index))
+                    for _, coin, recs in spent.values()
+                ],
+                return_exceptions=True,
+            )
+            frontier = {}
+            transitions = []
+            for (launcher_id, (index, coin, recs)), last_spend in zip(spent.items(), spends):
+                if last_spend is None or isinstance(last_spend, Exception):
+                    # leave this lineage out rather than stall the rest
+                    log.warning(f"Skipping NFT {launcher_id.hex()}: could not fetch spend of {coin.name().hex()}")
+                    continue
+                next_coin = next_singleton_coin(last_spend, recs)
+                height = recs[0].confirmed_block_index
+                transitions.append((launcher_id, index + 1, height, last_spend, next_coin))
+                frontier[launcher_id] = (index + 1, height, last_spend, next_coin)
+            await self.save_transitions(transitions)
+
+        launcher_spends = await self.get_transitions([launcher_id for launcher_id in heads], 0)
+        nfts = []
+        for launcher_id in launcher_ids:
+            if launcher_id not in heads:
+                continue
+            index, height, last_spend, coin = heads[launcher_id]
+            if index < 1:
+                # launcher or eve coin not spent yet
+                continue
+            nft = make_nft(launcher_id, coin, last_spend, launcher_spends[launcher_id])
+            nfts.append((nft, height))
+        await self.save_nfts(nfts)
+        if commit:
+            await self.db_connection.commit()
+        return [nft for nft, _ in nfts]
+
+    async def limited(self, coro):
+        async with self.semaphore:
+            return await asyncio.wait_for(coro, self.timeout)
+
+    async def save_transitions(self, transitions: List[Tuple[bytes32, int, int, CoinSpend, Coin]]):
+        """Write (launcher_id, index, height, coin_spend, next_coin) rows. The caller commits."""
+        await self.db_connection.executemany(
+            "INSERT OR REPLACE INTO nft_state_transitions VALUES (?, ?, ?, ?, ?)",
+            [
+                (bytes(launcher_id), index, height, bytes(coin_spend), coin_to_bytes(next_coin))
+                for launcher_id, index, height, coin_spend, next_coin in transitions
+            ],
         )
-        nft_data = launcher_spend.solution.to_program().uncurry()[0].as_python()[-1]
-
-        while True:
-            current_coin_record = await self.node_client.get_coin_record_by_name(nft_id)
-            if current_coin_record.spent:
-                next_coin_records = await self.node_client.get_coin_records_by_parent_ids([nft_id])
-                last_spend = await self.node_client.get_puzzle_and_solution(
-                    current_coin_record.coin.name(), current_coin_record.spent_block_index
-                )
-                if len(next_coin_records) == 3:
-                    # last spend was purchase spend, so separate out the puzzlehashes
-                    _, args = last_spend.puzzle_reveal.to_program().uncurry()
-                    _, inner_puzzle = list(args.as_iter())
-                    _, inner_args = inner_puzzle.uncurry()
-                    state = inner_args.rest().first().as_python()
-                    royalty = inner_args.rest().rest().first().as_python()
-                    for rec in next_coin_records:
-                        if rec.coin.puzzle_hash not in [state[2], royalty[0]]:
-                            next_parent = rec.coin
-                if len(next_coin_records) == 1:
-                    next_parent = next_coin_records[0].coin
-                nft_id = next_parent.name()
-                last_coin_record = current_coin_record
-            else:
-                last_spend = await self.node_client.get_puzzle_and_solution(
-                    last_coin_record.coin.name(), last_coin_record.spent_block_index
-                )
-                _, args = last_spend.puzzle_reveal.to_program().uncurry()
-                _, inner_puzzle = list(args.as_iter())
-                _, inner_args = inner_puzzle.uncurry()
-                # state = inner_args.rest().first().as_python()
-                royalty = inner_args.rest().rest().first().as_python()
-                nft = NFT(launcher_id, current_coin_record.coin, last_spend, nft_data, royalty)
-                await self.save_nft(nft)
-                return nft
+
+    async def get_transitions(self, launcher_ids: List[bytes32], index: int) -> Dict[bytes32, CoinSpend]:
+        spends = {}
+        for chunk in chunks(launcher_ids, SQLITE_MAX_VARIABLES - 1):
+            cursor = await self.db_connection.execute(
+                "SELECT launcher_id, coin_spend FROM nft_state_transitions "
+                f"WHERE transition_index = ? AND launcher_id IN ({','.join('?' * len(chunk))})",
+                (index, *[bytes(launcher_id) for launcher_id in chunk]),
+            )
+            for row in await cursor.fetchall():
+                spends[bytes32(row[0])] = CoinSpend.from_bytes(row[1])
+            await cursor.close()
+        return spends
+
+    async def get_latest_transitions(
+        self, launcher_ids: List[bytes32]
+    ) -> Dict[bytes32, Tuple[int, int, CoinSpend, Coin]]:
+        """Return (index, height, coin_spend, next_coin) for the last recorded spend of each singleton"""
+        latest = {}
+        for chunk in chunks(launcher_ids, SQLITE_MAX_VARIABLES):
+            # sqlite takes the bare columns from the row holding the MAX()
+            cursor = await self.db_connection.execute(
+                "SELECT launcher_id, MAX(transition_index), height, coin_spend, next_coin FROM nft_state_transitions "
+                f"WHERE launcher_id IN ({','.join('?' * len(chunk))}) GROUP BY launcher_id",
+                [bytes(launcher_id) for launcher_id in chunk],
+            )
+            for row in await cursor.fetchall():
+                latest[bytes32(row[0])] = (row[1], row[2], CoinSpend.from_bytes(row[3]), coin_from_bytes(row[4]))
+            await cursor.close()
+        return latest
+
+    async def get_latest_transition_index(self, launcher_id: bytes32) -> int:
+        cursor = await self.db_connection.execute(
+            "SELECT MAX(transition_index) FROM nft_state_transitions WHERE launcher_id = ?", (bytes(launcher_id),)
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row[0] if row[0] is not None else -1
+
+    async def get_latest_transition(self, launcher_id: bytes32) -> Optional[Tuple[int, int, CoinSpend, Coin]]:
+        latest = await self.get_latest_transitions([bytes32(launcher_id)])
+        return latest.get(bytes32(launcher_id))
 
     async def basic_sync(self):
-        all_nfts = await self.node_client.get_coin_records_by_puzzle_hash(LAUNCHER_PUZZLE_HASH)
+        all_nfts = await self.node_client.get_coin_records_by_puzzle_hash(puzzles.LAUNCHER_PUZZLE_HASH)
         await self.filter_singletons(all_nfts)
         await self.update_to_current_block()
 
     async def save_launcher(self, launcher_id, pk=b""):
+        await self.save_launchers([(launcher_id, pk)])
+        await self.db_connection.commit()
+
+    async def save_launchers(self, launchers: List[Tuple[bytes32, bytes]]):
+        await self.db_connection.executemany(
+            "INSERT OR REPLACE INTO nft_coins (launcher_id, owner_pk) VALUES (?, ?)",
+            [(bytes(launcher_id), bytes(pk)) for launcher_id, pk in launchers],
+        )
+
+    async def save_nft(self, nft: NFT, height: int = 0):
+        await self.save_nfts([(nft, height)])
+        await self.db_connection.commit()
+
+    async def save_nfts(self, nfts: List[Tuple[NFT, int]]):
+        """Write the current state of each (nft, height). The caller commits."""
+        await self.save_launchers([(nft.launcher_id, nft.owner_pk()) for nft, _ in nfts])
+        await self.db_connection.executemany(
+            "INSERT OR REPLACE INTO nft_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    bytes(nft.launcher_id),
+                    bytes(nft.name()),
+                    int(bool(nft.is_for_sale())),
+                    nft.price(),
+                    bytes(nft.owner_puzzle_hash()),
+                    bytes(nft.owner_pk()),
+                    nft.royalty_pc(),
+                    bytes(nft.creator_puzzle_hash()),
+                    height,
+                    nft.to_bytes(),
+                )
+                for nft, height in nfts
+            ],
+        )
+
+    async def save_heartbeat(self, pid: int, owner_pk: G1Element, peak: int, poll_interval: float):
         cursor = await self.db_connection.execute(
-            "INSERT OR REPLACE INTO nft_coins (launcher_id, owner_pk) VALUES (?, ?)", (bytes(launcher_id), bytes(pk))
+            "INSERT OR REPLACE INTO daemon_heartbeat VALUES (0, ?, ?, ?, ?, ?)",
+            (pid, bytes(owner_pk), peak, poll_interval, time.time()),
         )
         await cursor.close()
         await self.db_connection.commit()
 
-    async def save_nft(self, nft: NFT):
-        # add launcher_id, owner_pk to db
+    async def clear_heartbeat(self):
+        cursor = await self.db_connection.execute("DELETE FROM daemon_heartbeat")
+        await cursor.close()
+        await self.db_connection.commit()
+
+    async def get_live_heartbeat(self) -> Optional[Tuple[int, G1Element, int]]:
+        """Return (pid, owner_pk, peak) if a daemon has refreshed the store recently enough to trust it"""
         cursor = await self.db_connection.execute(
-            "INSERT OR REPLACE INTO nft_coins (launcher_id, owner_pk) VALUES (?,?)",
-            (bytes(nft.launcher_id), bytes(nft.owner_pk())),
+            "SELECT pid, owner_pk, peak, poll_interval, updated_at FROM daemon_heartbeat"
         )
+        row = await cursor.fetchone()
         await cursor.close()
+        if row is None:
+            return None
+        pid, owner_pk, peak, poll_interval, updated_at = row
+        if time.time() - updated_at > max(poll_interval * HEARTBEAT_MISSES, HEARTBEAT_MIN_AGE):
+            return None
+        return (pid, G1Element.from_bytes(owner_pk), peak)
+
+    async def save_derived_keys(
+        self, fingerprint: int, keys: List[Tuple[str, int, G1Element, G1Element, Optional[bytes32]]]
+    ):
+        await self.db_connection.executemany(
+            "INSERT OR REPLACE INTO derived_keys VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (fingerprint, kind, index, bytes(pk), bytes(synthetic_pk), bytes(ph) if ph else None)
+                for kind, index, pk, synthetic_pk, ph in keys
+            ],
+        )
         await self.db_connection.commit()
 
+    async def get_derived_keys(
+        self, fingerprint: int
+    ) -> List[Tuple[str, int, G1Element, G1Element, Optional[bytes32]]]:
+        cursor = await self.db_connection.execute(
+            "SELECT kind, idx, pk, synthetic_pk, puzzle_hash FROM derived_keys WHERE fingerprint = ?", (fingerprint,)
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return [
+            (
+                row[0],
+                row[1],
+                G1Element.from_bytes(row[2]),
+                G1Element.from_bytes(row[3]),
+                bytes32(row[4]) if row[4] else None,
+            )
+            for row in rows
+        ]
+
+    async def get_cached_nft_pk(self) -> Optional[G1Element]:
+        """The NFT owner key from the derived key cache, if it holds exactly one wallet's"""
+        cursor = await self.db_connection.execute(
+            "SELECT synthetic_pk FROM derived_keys WHERE kind = 'nft' AND idx = 0 LIMIT 2"
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        if len(rows) == 1:
+            return G1Element.from_bytes(rows[0][0])
+
+    async def _select_indexed_nfts(self, where: str = "", params: Tuple = ()) -> List[NFT]:
+        cursor = await self.db_connection.execute(f"SELECT nft FROM nft_state {where}", params)
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return [NFT.from_bytes(row[0]) for row in rows]
+
+    async def get_indexed_nft(self, launcher_id: bytes32) -> Optional[NFT]:
+        nfts = await self._select_indexed_nfts("WHERE launcher_id = ?", (bytes(launcher_id),))
+        if nfts:
+            return nfts[0]
+
+    async def get_indexed_nfts(self, launcher_ids: List[bytes32]) -> List[NFT]:
+        nfts = []
+        for chunk in chunks(launcher_ids, SQLITE_MAX_VARIABLES):
+            params = tuple(bytes(launcher_id) for launcher_id in chunk)
+            nfts += await self._select_indexed_nfts(f"WHERE launcher_id IN ({','.join('?' * len(chunk))})", params)
+        return nfts
+
+    async def get_indexed_nfts_by_owner(self, pk: G1Element) -> List[NFT]:
+        return await self._select_indexed_nfts("WHERE owner_pk = ?", (bytes(pk),))
+
+    async def get_indexed_for_sale_nfts(self, exclude_pk: G1Element = None) -> List[NFT]:
+        if exclude_pk is None:
+            return await self._select_indexed_nfts("WHERE for_sale = 1 ORDER BY price")
+        return await self._select_indexed_nfts(
+            "WHERE for_sale = 1 AND owner_pk != ? ORDER BY price", (bytes(exclude_pk),)
+        )
+
+    async def get_tracked_coins(self) -> Dict[bytes32, bytes32]:
+        cursor = await self.db_connection.execute("SELECT coin_id, launcher_id FROM nft_state")
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return {bytes32(row[0]): bytes32(row[1]) for row in rows}
+
+    async def get_unindexed_nft_ids(self):
+        query = "SELECT launcher_id FROM nft_coins WHERE launcher_id NOT IN (SELECT launcher_id FROM nft_state)"
+        cursor = await self.db_connection.execute(query)
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return list(map(lambda x: x[0], rows))
+
     async def get_all_nft_ids(self):
         query = "SELECT launcher_id FROM nft_coins"
         cursor = await self.db_connection.execute(query)
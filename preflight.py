@@ -0,0 +1,144 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+from clvm.casts import int_from_bytes
+from clvm.EvalError import EvalError
+
+from chia.consensus.condition_costs import ConditionCost
+from chia.consensus.default_constants import DEFAULT_CONSTANTS
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program, INFINITE_COST
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.coin_spend import CoinSpend
+from chia.util.condition_tools import ConditionOpcode
+from chia.util.hash import std_hash
+
+
+class PreflightError(Exception):
+    """A spend bundle the mempool would reject, caught before it was pushed"""
+
+
+class PreflightReport(NamedTuple):
+    spends: int
+    clvm_cost: int
+    condition_cost: int
+    size: int
+    cost: int
+    max_cost: int
+
+    def __str__(self) -> str:
+        return (
+            f"{self.cost} ({self.cost / self.max_cost:.2%} of the limit) for {self.spends} spends, "
+            f"{self.size} bytes: clvm {self.clvm_cost}, conditions {self.condition_cost}, "
+            f"size {self.size * DEFAULT_CONSTANTS.COST_PER_BYTE}"
+        )
+
+
+def failure_message(coin_spend: CoinSpend) -> str:
+    """Why a spend fails, rerun in python clvm since it keeps the (x ...) message"""
+    try:
+        coin_spend.puzzle_reveal.to_program().run(coin_spend.solution.to_program())
+    except EvalError as e:
+        raised = Program.to(e._sexp)
+        if raised.listp() and raised.first().atom:
+            return raised.first().as_python().decode("utf-8", "replace")
+        return str(e.args[0])
+    return "unknown error"
+
+
+def run_spend(coin_spend: CoinSpend) -> Tuple[int, List[List[bytes]]]:
+    """Run a spend with cost accounting, returning its CLVM cost and its conditions as atom lists"""
+    try:
+        cost, result = coin_spend.puzzle_reveal.run_with_cost(INFINITE_COST, coin_spend.solution)
+    except (ValueError, EvalError):
+        raise PreflightError(f"Spend of coin {coin_spend.coin.name().hex()} fails: {failure_message(coin_spend)}")
+    return cost, [cond.as_atom_list() for cond in result.as_iter()]
+
+
+def conditions_cost(conditions: List[List[bytes]]) -> int:
+    cost = 0
+    for opcode, *_ in conditions:
+        if opcode == ConditionOpcode.CREATE_COIN.value:
+            cost += ConditionCost.CREATE_COIN.value
+        elif opcode in (ConditionOpcode.AGG_SIG_ME.value, ConditionOpcode.AGG_SIG_UNSAFE.value):
+            cost += ConditionCost.AGG_SIG.value
+    return cost
+
+
+def spend_size(coin_spend: CoinSpend) -> int:
+    return len(bytes(coin_spend.puzzle_reveal)) + len(bytes(coin_spend.solution))
+
+
+def spend_cost(coin_spend: CoinSpend) -> int:
+    """Estimated block cost of a spend: CLVM run, CREATE_COIN and AGG_SIG conditions, and its size"""
+    clvm_cost, conditions = run_spend(coin_spend)
+    return clvm_cost + conditions_cost(conditions) + spend_size(coin_spend) * DEFAULT_CONSTANTS.COST_PER_BYTE
+
+
+def preflight(coin_spends: List[CoinSpend], max_cost: int) -> PreflightReport:
+    """Check a bundle the way the mempool would, as far as it can be done without the chain.
+
+    Every puzzle reveal must match its coin and every spend must run, with its ASSERT_MY
+    conditions holding. Every asserted coin or puzzle announcement must be made inside the
+    bundle, no coin may be spent or created twice, no value may be created, and the
+    estimated cost must fit in max_cost. Raises PreflightError on the first failure.
+    """
+    removals: Dict[bytes32, Coin] = {}
+    additions: Dict[bytes32, Coin] = {}
+    announcements = set()
+    asserted: List[Tuple[bytes32, bytes32]] = []
+    clvm_cost = condition_cost = size = 0
+
+    for coin_spend in coin_spends:
+        coin = coin_spend.coin
+        coin_id = coin.name()
+        if coin_id in removals:
+            raise PreflightError(f"Coin {coin_id.hex()} is spent twice")
+        removals[coin_id] = coin
+        if coin_spend.puzzle_reveal.get_tree_hash() != coin.puzzle_hash:
+            raise PreflightError(f"Puzzle reveal doesn't match coin {coin_id.hex()}")
+
+        cost, conditions = run_spend(coin_spend)
+        clvm_cost += cost
+        condition_cost += conditions_cost(conditions)
+        size += spend_size(coin_spend)
+
+        asserts_self = {
+            ConditionOpcode.ASSERT_MY_COIN_ID.value: coin_id,
+            ConditionOpcode.ASSERT_MY_PARENT_ID.value: coin.parent_coin_info,
+            ConditionOpcode.ASSERT_MY_PUZZLEHASH.value: coin.puzzle_hash,
+        }
+        for opcode, *args in conditions:
+            if opcode == ConditionOpcode.CREATE_COIN.value:
+                child = Coin(coin_id, bytes32(args[0]), int_from_bytes(args[1]))
+                if child.name() in additions:
+                    raise PreflightError(f"Coin {coin_id.hex()} creates {child.name().hex()} twice")
+                additions[child.name()] = child
+            elif opcode == ConditionOpcode.CREATE_COIN_ANNOUNCEMENT.value:
+                announcements.add(std_hash(coin_id + args[0]))
+            elif opcode == ConditionOpcode.CREATE_PUZZLE_ANNOUNCEMENT.value:
+                announcements.add(std_hash(coin.puzzle_hash + args[0]))
+            elif opcode in (
+                ConditionOpcode.ASSERT_COIN_ANNOUNCEMENT.value,
+                ConditionOpcode.ASSERT_PUZZLE_ANNOUNCEMENT.value,
+            ):
+                asserted.append((coin_id, args[0]))
+            elif opcode in asserts_self and args[0] != asserts_self[opcode]:
+                raise PreflightError(f"{ConditionOpcode(opcode).name} fails for coin {coin_id.hex()}")
+            elif opcode == ConditionOpcode.ASSERT_MY_AMOUNT.value and int_from_bytes(args[0]) != coin.amount:
+                raise PreflightError(f"ASSERT_MY_AMOUNT fails for coin {coin_id.hex()}")
+
+    # the singleton, p2 and payment spends of a buy are tied together by announcements
+    for coin_id, announcement in asserted:
+        if announcement not in announcements:
+            raise PreflightError(f"Coin {coin_id.hex()} asserts an announcement no spend in the bundle makes")
+
+    removed = sum(coin.amount for coin in removals.values())
+    added = sum(coin.amount for coin in additions.values())
+    if added > removed:
+        raise PreflightError(f"Bundle creates {added - removed} more mojos than it spends")
+
+    cost = clvm_cost + condition_cost + size * DEFAULT_CONSTANTS.COST_PER_BYTE
+    report = PreflightReport(len(coin_spends), clvm_cost, condition_cost, size, cost, max_cost)
+    if cost > max_cost:
+        raise PreflightError(f"Bundle cost {cost} is over the limit of {max_cost}")
+    return report
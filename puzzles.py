@@ -0,0 +1,128 @@
+from functools import lru_cache
+from typing import Tuple
+
+from chia.types.blockchain_format.program import Program, SerializedProgram
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.util.hash import std_hash
+from chia.wallet.puzzles.load_clvm import load_clvm
+
+from clsp_loader import load_clsp_relative
+
+
+# Every puzzle used by the driver and wallet is loaded here, together with its
+# tree hash and serialized form, the first time it is used as `puzzles.NAME`
+# (`NAME_HASH`, `NAME_SERIALIZED`) and then kept, so the hot paths never hash or
+# serialize a module again and commands that don't spend or sync never load them
+# at all.
+
+_LOADERS = {
+    "SINGLETON_MOD": lambda: load_clvm("singleton_top_layer.clvm"),
+    "LAUNCHER_PUZZLE": lambda: load_clsp_relative("clsp/nft_launcher.clsp"),
+    "INNER_MOD": lambda: load_clsp_relative("clsp/creator_nft.clsp"),
+    "INNER_MOD_V2": lambda: load_clsp_relative("clsp/creator_nft_v2.clsp"),
+    "P2_MOD": lambda: load_clsp_relative("clsp/p2_creator_nft.clsp"),
+}
+
+# Every creator NFT inner puzzle, newest first. Each one curries in its own mod hash
+# and recreates itself, so an NFT keeps the puzzle it was launched with; new NFTs
+# are launched with the first.
+_INNER_MODS = ("INNER_MOD_V2", "INNER_MOD")
+
+
+def _load(name: str):
+    if name in globals():
+        return globals()[name]
+    if name in _LOADERS:
+        value = _LOADERS[name]()
+    elif name.endswith("_HASH") and name[: -len("_HASH")] in _LOADERS:
+        value = _load(name[: -len("_HASH")]).get_tree_hash()
+    elif name.endswith("_SERIALIZED") and name[: -len("_SERIALIZED")] in _LOADERS:
+        value = SerializedProgram.from_program(_load(name[: -len("_SERIALIZED")]))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __getattr__(name: str):
+    # only reached while a name hasn't been loaded into the module yet
+    return _load(name)
+
+
+# tree hashes of the atoms a curried program is built from: (a (q . MOD) (c (q . ARG) ... 1))
+_A_HASH = std_hash(b"\x01\x02")
+_Q_HASH = std_hash(b"\x01\x01")
+_C_HASH = std_hash(b"\x01\x04")
+_NIL_HASH = std_hash(b"\x01")
+
+
+def _pair_hash(first: bytes32, rest: bytes32) -> bytes32:
+    return std_hash(b"\x02" + first + rest)
+
+
+def _list_hash(*item_hashes: bytes32) -> bytes32:
+    tree_hash = _NIL_HASH
+    for item_hash in reversed(item_hashes):
+        tree_hash = _pair_hash(item_hash, tree_hash)
+    return tree_hash
+
+
+def curried_tree_hash(mod_hash: bytes32, *arg_hashes: bytes32) -> bytes32:
+    """The tree hash of a mod curried with some arguments, from their tree hashes alone"""
+    env_hash = _Q_HASH  # the atom 1 that ends the curried environment, which hashes like q
+    for arg_hash in reversed(arg_hashes):
+        env_hash = _list_hash(_C_HASH, _pair_hash(_Q_HASH, arg_hash), env_hash)
+    return bytes32(_list_hash(_A_HASH, _pair_hash(_Q_HASH, mod_hash), env_hash))
+
+
+def curry_serialized(mod: SerializedProgram, *args: bytes) -> SerializedProgram:
+    """Program.curry on serialized programs, by splicing their bytes into the curried form"""
+    env = b"\x01"
+    for arg in reversed(args):
+        env = b"\xff\x04\xff\xff\x01" + arg + b"\xff" + env + b"\x80"
+    return SerializedProgram.from_bytes(b"\xff\x02\xff\xff\x01" + bytes(mod) + b"\xff" + env + b"\x80")
+
+
+@lru_cache(maxsize=1024)
+def singleton_struct(launcher_id: bytes32) -> Program:
+    """The (MOD_HASH . (LAUNCHER_ID . LAUNCHER_PUZZLE_HASH)) struct curried into a singleton"""
+    return Program.to((_load("SINGLETON_MOD_HASH"), (launcher_id, _load("LAUNCHER_PUZZLE_HASH"))))
+
+
+@lru_cache(maxsize=1024)
+def singleton_struct_hash(launcher_id: bytes32) -> bytes32:
+    return singleton_struct(launcher_id).get_tree_hash()
+
+
+@lru_cache(maxsize=1024)
+def p2_puzzle_for_launcher(launcher_id: bytes32) -> Program:
+    return _load("P2_MOD").curry(_load("SINGLETON_MOD_HASH"), launcher_id, _load("LAUNCHER_PUZZLE_HASH"))
+
+
+@lru_cache(maxsize=1024)
+def p2_puzzle_hash_for_launcher(launcher_id: bytes32) -> bytes32:
+    return p2_puzzle_for_launcher(launcher_id).get_tree_hash()
+
+
+@lru_cache(maxsize=1024)
+def p2_puzzle_reveal_for_launcher(launcher_id: bytes32) -> SerializedProgram:
+    return SerializedProgram.from_program(p2_puzzle_for_launcher(launcher_id))
+
+
+def inner_mod_hashes() -> Tuple[bytes32, ...]:
+    return tuple(_load(f"{name}_HASH") for name in _INNER_MODS)
+
+
+def _inner_mod_name(mod_hash: bytes32) -> str:
+    for name in _INNER_MODS:
+        if _load(f"{name}_HASH") == mod_hash:
+            return name
+    raise ValueError(f"Unknown creator NFT inner puzzle {mod_hash.hex()}")
+
+
+def inner_mod(mod_hash: bytes32) -> Program:
+    return _load(_inner_mod_name(mod_hash))
+
+
+def serialized_inner_mod(mod_hash: bytes32) -> SerializedProgram:
+    return _load(f"{_inner_mod_name(mod_hash)}_SERIALIZED")
@@ -0,0 +1,95 @@
+import asyncio
+import inspect
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from blspy import AugSchemeMPL, G1Element, G2Element, PrivateKey
+
+from chia.types.coin_spend import CoinSpend
+from chia.types.spend_bundle import SpendBundle
+from chia.util.condition_tools import conditions_dict_for_solution, pkm_pairs_for_conditions_dict
+
+
+# below this many signatures, handing work to other processes costs more than it saves
+PARALLEL_SIGNING_THRESHOLD = 32
+
+
+def signature_requests(
+    coin_spends: List[CoinSpend], additional_data: bytes, max_cost: int
+) -> List[Tuple[G1Element, bytes]]:
+    """(pk, message) for every AGG_SIG condition, running each puzzle once"""
+    requests = []
+    for coin_spend in coin_spends:
+        err, conditions_dict, _ = conditions_dict_for_solution(coin_spend.puzzle_reveal, coin_spend.solution, max_cost)
+        if err or conditions_dict is None:
+            raise ValueError(f"Sign transaction failed, con:{conditions_dict}, error: {err}")
+        for pk_bytes, msg in pkm_pairs_for_conditions_dict(conditions_dict, coin_spend.coin.name(), additional_data):
+            requests.append((G1Element.from_bytes(pk_bytes), msg))
+    return requests
+
+
+def sign_and_aggregate(items: List[Tuple[bytes, bytes]]) -> bytes:
+    """Sign (secret key, message) pairs and return the verified aggregate. Runs in the worker processes."""
+    sks = [PrivateKey.from_bytes(sk) for sk, _ in items]
+    msgs = [msg for _, msg in items]
+    aggsig = AugSchemeMPL.aggregate([AugSchemeMPL.sign(sk, msg) for sk, msg in zip(sks, msgs)])
+    assert AugSchemeMPL.aggregate_verify([sk.get_g1() for sk in sks], msgs, aggsig)
+    # blspy elements don't pickle, so they cross the process boundary as bytes
+    return bytes(aggsig)
+
+
+async def sign_coin_spends(
+    coin_spends: List[CoinSpend],
+    secret_key_for_public_key_f: Any,
+    additional_data: bytes,
+    max_cost: int,
+    executor: Optional[Executor] = None,
+    parallel_threshold: int = PARALLEL_SIGNING_THRESHOLD,
+    executor_factory: Optional[Callable[[], Executor]] = None,
+) -> SpendBundle:
+    """A drop-in for chia's sign_coin_spends that signs large bundles in a process pool.
+
+    Each secret key is looked up once however many spends it signs. The signatures are
+    split into one chunk per worker and every worker returns a verified partial
+    aggregate, so signing and verification both scale with the number of cores.
+
+    executor_factory is only called once the signature count reaches parallel_threshold,
+    so a caller can keep a pool without starting it for bundles that sign inline.
+    """
+    requests = signature_requests(coin_spends, additional_data, max_cost)
+
+    keys: Dict[bytes, bytes] = {}
+    for pk, _ in requests:
+        if bytes(pk) in keys:
+            continue
+        if inspect.iscoroutinefunction(secret_key_for_public_key_f):
+            secret_key = await secret_key_for_public_key_f(pk)
+        else:
+            secret_key = secret_key_for_public_key_f(pk)
+        if secret_key is None:
+            raise ValueError(f"no secret key for {pk}")
+        assert bytes(secret_key.get_g1()) == bytes(pk)
+        keys[bytes(pk)] = bytes(secret_key)
+    items = [(keys[bytes(pk)], msg) for pk, msg in requests]
+
+    if len(items) < parallel_threshold:
+        return SpendBundle(coin_spends, G2Element.from_bytes(sign_and_aggregate(items)))
+
+    own_executor = executor is None and executor_factory is None
+    if executor is None:
+        executor = executor_factory() if executor_factory else ProcessPoolExecutor()
+    try:
+        workers = getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+        size = -(-len(items) // workers)
+        loop = asyncio.get_running_loop()
+        parts = await asyncio.gather(
+            *[
+                loop.run_in_executor(executor, sign_and_aggregate, items[i : i + size])
+                for i in range(0, len(items), size)
+            ]
+        )
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return SpendBundle(coin_spends, AugSchemeMPL.aggregate([G2Element.from_bytes(part) for part in parts]))
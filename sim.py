@@ -23,10 +23,11 @@ from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import (  # standa
     calculate_synthetic_secret_key,
     DEFAULT_HIDDEN_PUZZLE_HASH,
 )
-from clvm_tools.clvmc import compile_clvm
 from chia.clvm.spend_sim import SpendSim, SimClient
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
 
+from clsp_loader import CLSP_CACHE_DIR, clsp_source_digest, load_clsp_relative  # noqa: F401
+
 duration_div = 86400.0
 block_time = (600.0 / 32.0) / duration_div
 # Allowed subdivisions of 1 coin
@@ -703,16 +704,3 @@ async def setup_node_only():
     node = await Network.create()
     await node.farm_block()
     return node
-
-
-def load_clsp_relative(filename: str, search_paths: List[Path] = [Path("include/")]):
-    base = Path().parent.resolve()
-    source = base / filename
-    target = base / f"{filename}.hex"
-    searches = [base / s for s in search_paths]
-    compile_clvm(source, target, searches)
-    clvm = target.read_text()
-    clvm_blob = bytes.fromhex(clvm)
-
-    sp = SerializedProgram.from_bytes(clvm_blob)
-    return Program.from_bytes(bytes(sp))
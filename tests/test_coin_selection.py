@@ -0,0 +1,36 @@
+import pytest
+
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.sized_bytes import bytes32
+
+from CreatorNFT.coin_selection import STRATEGIES
+
+
+PH = bytes32(b"p" * 32)
+
+
+def coins(*amounts):
+    return [Coin(bytes32(i.to_bytes(32, "big")), PH, amt) for i, amt in enumerate(amounts)]
+
+
+class TestCoinSelection:
+    def test_strategies(self):
+        wallet = coins(5, 40, 100, 250, 1000)
+
+        assert [c.amount for c in STRATEGIES["exact"](wallet, 100, 1)] == [100]
+        assert STRATEGIES["exact"](wallet, 101, 1) is None
+
+        assert [c.amount for c in STRATEGIES["smallest_sufficient"](wallet, 101, 1)] == [250]
+        assert STRATEGIES["smallest_sufficient"](wallet, 1001, 1) is None
+
+        assert [c.amount for c in STRATEGIES["largest"](wallet, 101, 1)] == [1000]
+        assert STRATEGIES["largest"](wallet, 1001, 1) is None
+
+        assert [c.amount for c in STRATEGIES["best_fit"](wallet, 250, 1)] == [250]
+        assert [c.amount for c in STRATEGIES["best_fit"](wallet, 1200, 2)] == [250, 1000]
+        assert STRATEGIES["best_fit"](wallet, 1200, 1) is None
+
+        # dust gets swept up first, coins made redundant are dropped
+        assert [c.amount for c in STRATEGIES["combine"](wallet, 140, 5)] == [40, 100]
+        assert [c.amount for c in STRATEGIES["combine"](coins(10, 20, 30, 40), 90, 3)] == [20, 30, 40]
+        assert STRATEGIES["combine"](wallet, 1300, 2) is None
@@ -29,7 +29,55 @@ from tests.setup_nodes import bt, setup_simulators_and_wallets, self_hostname
 from tests.time_out_assert import time_out_assert
 from tests.util.rpc import validate_get_routes
 from tests.connection_utils import connect_and_get_peer
-from nft_manager import NFTManager
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import Program
+from chia.types.coin_spend import CoinSpend
+from chia.wallet.lineage_proof import LineageProof
+from chia.wallet.puzzles import singleton_top_layer
+from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import puzzle_for_pk
+import nft_manager
+from nft_manager import ConfirmationError, NFTManager
+from nft import read_manager
+import driver
+import puzzles
+
+
+# an inner puzzle that isn't a creator NFT: it returns the conditions it is given,
+# after the three curried arguments and the singleton truths
+FOREIGN_INNER_MOD = Program.to([5, [6, [6, [6, [6, 1]]]]])
+
+
+async def launch_foreign_singleton(manager: NFTManager, amount: int = 101) -> bytes32:
+    """Launch a singleton through the creator NFT launcher, but with FOREIGN_INNER_MOD inside"""
+    state = [0, 1000, bytes32(b"s" * 32), bytes(manager.nft_pk)]
+    royalty = [bytes32(b"r" * 32), 10]
+    found_coin, found_coin_puzzle = await manager.choose_std_coin(amount)
+    launcher_coin = Coin(found_coin.name(), puzzles.LAUNCHER_PUZZLE_HASH, amount)
+    inner = FOREIGN_INNER_MOD.curry(FOREIGN_INNER_MOD.get_tree_hash(), state, royalty)
+    full = puzzles.SINGLETON_MOD.curry(puzzles.singleton_struct(launcher_coin.name()), inner)
+    launcher_solution = Program.to(
+        [
+            full.get_tree_hash(),
+            puzzles.SINGLETON_MOD_HASH,
+            launcher_coin.name(),
+            puzzles.LAUNCHER_PUZZLE_HASH,
+            FOREIGN_INNER_MOD.get_tree_hash(),
+            state,
+            royalty,
+            amount,
+            ("Foreign", "singleton"),
+        ]
+    )
+    launcher_spend = CoinSpend(launcher_coin, puzzles.LAUNCHER_PUZZLE, launcher_solution)
+    found_spend = driver.make_found_spend(found_coin, found_coin_puzzle, launcher_spend, amount)
+    eve_coin = Coin(launcher_coin.name(), full.get_tree_hash(), amount)
+    eve_solution = singleton_top_layer.solution_for_singleton(
+        LineageProof(found_coin.name(), None, amount), amount, [[[51, inner.get_tree_hash(), amount]]]
+    )
+    sb = await manager.sign([launcher_spend, found_spend, CoinSpend(eve_coin, full, eve_solution)])
+    res = await manager.node_client.push_tx(sb)
+    assert res["success"]
+    return launcher_coin.name()
 
 
 class TestNFTWallet:
@@ -302,6 +350,73 @@ class TestNFTWallet:
         assert int_from_bytes(nft.state()[0]) == new_state[0]
         assert int_from_bytes(nft.state()[1]) == new_state[1]
 
+    @pytest.mark.asyncio
+    async def test_lineage_resume(self, three_nft_managers):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+        amount = 101
+        nft_data = ("CreatorNFT", "some data")
+        not_for_sale_launch_state = [0, 1000]
+        royalty = [10]
+        tx_id, launcher_id = await man_0.launch_nft(amount, nft_data, not_for_sale_launch_state, royalty)
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+
+        nft = await man_0.view_nft(launcher_id)
+        index, _, last_spend, next_coin = await man_0.nft_wallet.get_latest_transition(launcher_id)
+        # launcher spend and eve spend
+        assert index == 1
+        assert next_coin.name() == nft.name()
+        with pytest.raises(ValueError, match="not for sale"):
+            await man_0.buy_nft(launcher_id, [0, 1000])
+
+        tx_id = await man_0.update_nft(launcher_id, [100, 5000])
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+
+        nft = await man_0.view_nft(launcher_id)
+        index, _, last_spend, next_coin = await man_0.nft_wallet.get_latest_transition(launcher_id)
+        assert index == 2
+        assert last_spend.coin.name() == nft.parent_coin_info
+        assert nft.is_for_sale()
+
+    @pytest.mark.asyncio
+    async def test_lineage_walk_stops_at_failed_lookup(self, three_nft_managers, monkeypatch):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+        tx_id, launcher_id = await man_0.launch_nft(101, ("CreatorNFT", "some data"), [0, 1000], [10])
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        tx_id = await man_0.update_nft(launcher_id, [100, 5000])
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        await man_1.connect()
+
+        # the third round, looking for the child of the first NFT coin, fails
+        calls = []
+        get_children = man_1.node_client.get_coin_records_by_parent_ids
+
+        async def flaky_get_children(coin_ids):
+            calls.append(coin_ids)
+            if len(calls) == 3:
+                raise ValueError("node went away")
+            return await get_children(coin_ids)
+
+        monkeypatch.setattr(man_1.node_client, "get_coin_records_by_parent_ids", flaky_get_children)
+        nfts = await man_1.nft_wallet.get_nfts_by_launcher_ids([launcher_id])
+        assert len(nfts) == 1
+        assert not nfts[0].is_for_sale()
+        index, _, _, _ = await man_1.nft_wallet.get_latest_transition(launcher_id)
+        assert index == 1
+
+        # the next walk carries on from there
+        nft = await man_1.nft_wallet.get_nft_by_launcher_id(launcher_id)
+        assert nft.is_for_sale()
+        index, _, _, _ = await man_1.nft_wallet.get_latest_transition(launcher_id)
+        assert index == 2
+
     @pytest.mark.asyncio
     async def test_buy_spends(self, three_nft_managers):
         man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
@@ -483,3 +598,287 @@ class TestNFTWallet:
         launched_nft = await man_1.get_my_nfts()
         assert launched_nft[0].price() == 1000
         assert launched_nft[0].is_for_sale()
+
+    @pytest.mark.asyncio
+    async def test_sync_skips_foreign_singletons(self, three_nft_managers):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+        await man_1.connect()
+        await man_1.nft_wallet.basic_sync()
+
+        foreign_id = await launch_foreign_singleton(man_0)
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        tx_id, launcher_id = await man_0.launch_nft(101, ("CreatorNFT", "some data"), [100, 1000], [10])
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+
+        # both launches arrive through sync_blocks, only the creator NFT is tracked and indexed
+        await man_1.nft_wallet.update_to_current_block()
+        assert [bytes32(i) for i in await man_1.nft_wallet.get_all_nft_ids()] == [launcher_id]
+        assert (await man_1.nft_wallet.get_indexed_nft(launcher_id)).is_for_sale()
+        assert await man_1.nft_wallet.get_indexed_nft(foreign_id) is None
+        assert await man_1.nft_wallet.get_latest_transition(foreign_id) is None
+
+    @pytest.mark.asyncio
+    async def test_rollback_to_fork_point(self, three_nft_managers):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+        tx_id, launcher_id = await man_0.launch_nft(101, ("CreatorNFT", "some data"), [0, 1000], [10])
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        tx_id = await man_0.update_nft(launcher_id, [100, 5000])
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        await man_0.nft_wallet.update_to_current_block()
+        index, update_height, _, _ = await man_0.nft_wallet.get_latest_transition(launcher_id)
+        assert index == 2
+
+        # pretend the blocks from the update onwards were replaced by a fork
+        cursor = await man_0.nft_wallet.db_connection.execute(
+            "UPDATE sync_checkpoints SET header_hash = ? WHERE height >= ?", (bytes(32), update_height)
+        )
+        await cursor.close()
+        await man_0.nft_wallet.db_connection.commit()
+        fork_height = await man_0.nft_wallet.find_fork_point()
+        assert fork_height == update_height - 1
+
+        await man_0.nft_wallet.rollback_to(fork_height)
+        assert await man_0.nft_wallet.retrieve_current_block() == fork_height
+        index, _, _, _ = await man_0.nft_wallet.get_latest_transition(launcher_id)
+        assert index == 1
+        assert not (await man_0.nft_wallet.get_indexed_nft(launcher_id)).is_for_sale()
+
+        # syncing again replays the update from the node's chain
+        await man_0.nft_wallet.update_to_current_block()
+        index, height, _, _ = await man_0.nft_wallet.get_latest_transition(launcher_id)
+        assert (index, height) == (2, update_height)
+        assert (await man_0.nft_wallet.get_indexed_nft(launcher_id)).is_for_sale()
+
+    @pytest.mark.asyncio
+    async def test_launch_nfts_in_two_bundles(self, three_nft_managers, monkeypatch):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+
+        # lower the cost limit so only two launches fit in a bundle
+        ph = bytes32(b"p" * 32)
+        launch = (101, [0, 1000, ph, man_0.nft_pk], [ph, 10], ("CreatorNFT", "some data"))
+        _, _, two_launches = driver.make_launch_chain(
+            Coin(bytes32(b"c" * 32), ph, 1000), puzzle_for_pk(man_0.nft_pk), [launch, launch], 2 ** 64
+        )
+        monkeypatch.setattr(nft_manager, "mempool_max_cost", lambda: two_launches + two_launches // 10)
+
+        bundles = await man_0.launch_nfts([(101, ("CreatorNFT", "some data"), [0, 1000], [10]) for _ in range(3)])
+        assert [len(launcher_ids) for _, launcher_ids in bundles] == [2, 1]
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        for tx_id, launcher_ids in bundles:
+            nft = await man_0.wait_for_confirmation(tx_id, launcher_ids[-1])
+            assert nft.launcher_id == launcher_ids[-1]
+
+        launched = [launcher_id for _, launcher_ids in bundles for launcher_id in launcher_ids]
+        assert sorted(nft.launcher_id for nft in await man_0.get_my_nfts()) == sorted(launched)
+
+    @pytest.mark.asyncio
+    async def test_update_nfts(self, three_nft_managers):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+        await man_1.connect()
+        await man_1.nft_wallet.basic_sync()
+        launcher_ids = []
+        for _ in range(0, 2):
+            tx_id, launcher_id = await man_0.launch_nft(101, ("CreatorNFT", "some data"), [0, 1000], [10])
+            launcher_ids.append(launcher_id)
+            for i in range(0, 5):
+                await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+
+        # both updates go out in one bundle under one aggregate signature
+        bundles = await man_0.update_nfts([(launcher_id, [100, 2000]) for launcher_id in launcher_ids])
+        assert [ids for _, ids in bundles] == [launcher_ids]
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        tx_id, ids = bundles[0]
+        await man_0.wait_for_confirmation(tx_id, ids[-1])
+        for launcher_id in launcher_ids:
+            nft = await man_0.view_nft(launcher_id)
+            assert nft.is_for_sale()
+            assert nft.price() == 2000
+
+        # only the owner can update them
+        with pytest.raises(ValueError):
+            await man_1.update_nfts([(launcher_ids[0], [0, 1000])])
+
+    @pytest.mark.asyncio
+    async def test_daemon_heartbeat(self, three_nft_managers):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect(sync=False)
+        # start well behind the peak so the first sync takes several batches
+        peak = await man_0.nft_wallet.get_current_height_from_node()
+        await man_0.nft_wallet.set_new_height(peak - 10)
+        await man_0.nft_wallet.db_connection.commit()
+        man_0.nft_wallet.batch_size = 2
+
+        async def reader_opens():
+            reader = NFTManager(db_name=man_0.db_name)
+            opened = await reader.open_store()
+            await reader.close()
+            return opened
+
+        # a reader arriving in the middle of the daemon's first sync uses the store,
+        # and the heartbeat follows the sync batch by batch
+        seen = []
+        sync_blocks = man_0.nft_wallet.sync_blocks
+
+        async def sync_blocks_and_read(start, end, tracked):
+            _, _, height = await man_0.nft_wallet.get_live_heartbeat()
+            seen.append((await reader_opens(), height == start - 1))
+            await sync_blocks(start, end, tracked)
+
+        man_0.nft_wallet.sync_blocks = sync_blocks_and_read
+        daemon = asyncio.create_task(man_0.run_daemon(poll_interval=0.1))
+
+        async def synced():
+            return await man_0.nft_wallet.retrieve_current_block() == peak
+
+        await time_out_assert(60, synced, True)
+        assert seen == [(True, True)] * 5
+        daemon.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await daemon
+        assert not await reader_opens()
+
+        # a heartbeat the daemon stopped refreshing is stale, and readers sync for themselves
+        await man_0.nft_wallet.save_heartbeat(1, man_0.nft_pk, peak, 0.1)
+        assert await reader_opens()
+        cursor = await man_0.nft_wallet.db_connection.execute("UPDATE daemon_heartbeat SET updated_at = updated_at - 60")
+        await cursor.close()
+        await man_0.nft_wallet.db_connection.commit()
+        assert not await reader_opens()
+
+        # nor do they touch a store at another version
+        await man_0.nft_wallet.save_heartbeat(1, man_0.nft_pk, peak, 0.1)
+        await man_0.nft_wallet.db_connection.execute("PRAGMA user_version = 1")
+        assert not await reader_opens()
+        cursor = await man_0.nft_wallet.db_connection.execute("PRAGMA user_version")
+        assert (await cursor.fetchone())[0] == 1
+        await cursor.close()
+
+    @pytest.mark.asyncio
+    async def test_wait_for_confirmation(self, three_nft_managers, monkeypatch):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+
+        # the coin looked for is the singleton child recorded at push time
+        tx_id, launcher_id = await man_0.launch_nft(101, ("CreatorNFT", "some data"), [0, 1000], [10])
+        child_id = man_0.expected_children[tx_id]
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        nft = await man_0.wait_for_confirmation(tx_id, launcher_id, confirmations=3)
+        assert nft.name() == child_id
+        assert tx_id not in man_0.expected_children
+
+        # a transaction the mempool doesn't hold, whose child never appears
+        dropped_tx_id = bytes32(b"d" * 32)
+        man_0.expected_children[dropped_tx_id] = bytes32(b"e" * 32)
+        with pytest.raises(ConfirmationError, match="dropped from the mempool"):
+            await man_0.wait_for_confirmation(dropped_tx_id, launcher_id)
+
+        # still in the mempool when the time is up
+        tx_id, pending_id = await man_0.launch_nft(101, ("CreatorNFT", "some data"), [0, 1000], [10])
+        with pytest.raises(ConfirmationError, match="not confirmed"):
+            await man_0.wait_for_confirmation(tx_id, pending_id, timeout=2)
+
+        # the child is seen in a block, then gone from the chain before it is buried deep enough
+        child_record = await man_0.node_client.get_coin_record_by_name(child_id)
+        records = [child_record]
+        peaks = iter(range(1000, 2000))
+
+        async def get_coin_record_by_name(name):
+            return records.pop() if records else None
+
+        async def get_current_height_from_node():
+            return next(peaks)
+
+        monkeypatch.setattr(man_0.node_client, "get_coin_record_by_name", get_coin_record_by_name)
+        monkeypatch.setattr(man_0.nft_wallet, "get_current_height_from_node", get_current_height_from_node)
+        reorged_tx_id = bytes32(b"r" * 32)
+        man_0.expected_children[reorged_tx_id] = child_id
+        with pytest.raises(ConfirmationError, match="reorged out"):
+            await man_0.wait_for_confirmation(reorged_tx_id, launcher_id, confirmations=2000)
+
+    @pytest.mark.asyncio
+    async def test_derived_key_cache(self, three_nft_managers, monkeypatch):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        assert len(man_0.unhardened_indexes) == man_0.gap_limit
+
+        # a coin at the last cached unhardened key makes the next load derive another gap_limit keys
+        last_ph = next(ph for ph, index in man_0.unhardened_indexes.items() if index == man_0.gap_limit - 1)
+        tx = await man_0.wallet_client.send_transaction("1", 1000, encode_puzzle_hash(last_ph, "txch"))
+
+        async def tx_in_mempool():
+            return (await man_0.wallet_client.get_transaction("1", tx.name)).is_in_mempool()
+
+        async def tx_confirmed():
+            return (await man_0.wallet_client.get_transaction("1", tx.name)).confirmed
+
+        await time_out_assert(5, tx_in_mempool, True)
+        for i in range(0, 5):
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        await time_out_assert(10, tx_confirmed, True)
+        await man_0.load_keys()
+        assert sorted(man_0.unhardened_indexes.values()) == list(range(2 * man_0.gap_limit))
+        assert len(await man_0.nft_wallet.get_derived_keys(man_0.fingerprint)) == 2 + 2 * man_0.gap_limit
+
+        # a warm start reads every key from the cache without asking the wallet for the secret key
+        async def get_private_key(fingerprint):
+            raise AssertionError("the secret key was fetched")
+
+        monkeypatch.setattr(man_0.wallet_client, "get_private_key", get_private_key)
+        warm = NFTManager(man_0.wallet_client, man_0.node_client, man_0.db_name)
+        await warm.connect()
+        assert warm.master_sk is None
+        assert warm.nft_pk == man_0.nft_pk
+        assert warm.std_puzzle_hashes == man_0.std_puzzle_hashes
+        assert warm.unhardened_indexes == man_0.unhardened_indexes
+        await warm.connection.close()
+
+    @pytest.mark.asyncio
+    async def test_for_sale_excludes_own_nfts(self, three_nft_managers, tmp_path):
+        man_0, man_1, man_2, full_node_api_0, full_node_api_1, full_node_api_2 = three_nft_managers
+        await man_0.connect()
+        await man_0.nft_wallet.basic_sync()
+        await man_2.connect()
+        await man_2.nft_wallet.basic_sync()
+        tx_id, own_id = await man_0.launch_nft(101, ("CreatorNFT", "some data"), [100, 1000], [10])
+        tx_id, other_id = await man_2.launch_nft(101, ("CreatorNFT", "other data"), [100, 2000], [10])
+        for i in range(0, 5):
+            await full_node_api_2.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+            await full_node_api_0.farm_new_transaction_block(FarmNewBlockProtocol(bytes32(b"a" * 32)))
+        await man_0.nft_wallet.update_to_current_block()
+        assert [nft.launcher_id for nft in await man_0.get_for_sale_nfts()] == [other_id]
+
+        # a reader with the owner key in the derived key cache never opens the wallet
+        reader = await read_manager(needs_owner=True, node_client=man_0.node_client, db_name=man_0.db_name)
+        assert reader.wallet_client is None
+        assert reader.nft_pk == man_0.nft_pk
+        assert [nft.launcher_id for nft in await reader.get_for_sale_nfts()] == [other_id]
+        await reader.connection.close()
+
+        # without a cached key it connects the wallet for it before listing
+        reader = await read_manager(
+            needs_owner=True,
+            wallet_client=man_0.wallet_client,
+            node_client=man_0.node_client,
+            db_name=tmp_path / "nft_store_reader.db",
+        )
+        assert reader.nft_pk == man_0.nft_pk
+        # the new store synced from the peak, so index the two launches explicitly
+        await reader.nft_wallet.get_nfts_by_launcher_ids([own_id, other_id])
+        assert [nft.launcher_id for nft in await reader.get_for_sale_nfts()] == [other_id]
+        await reader.connection.close()
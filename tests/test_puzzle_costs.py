@@ -0,0 +1,14 @@
+from CreatorNFT.tests.util.benchmark_puzzles import COST_THRESHOLD, INNER_MODS, ROYALTIES, load_baselines, measure_all
+
+
+class TestPuzzleCosts:
+    def test_cost_regression(self):
+        baselines = load_baselines()
+        results = measure_all()
+
+        paths = ["launch", "eve", "update", "trade"]
+        assert set(results) == {f"{prefix}{path}/{pc}" for prefix in INNER_MODS for path in paths for pc in ROYALTIES}
+        for path, result in results.items():
+            baseline = baselines[path]["cost"]
+            # regenerate with `python -m tests.util.benchmark_puzzles --update` when a rise is intended
+            assert result["cost"] <= baseline * (1 + COST_THRESHOLD), f"{path} costs {result['cost']} vs {baseline}"
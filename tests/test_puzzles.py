@@ -1,4 +1,5 @@
 import pytest
+from pathlib import Path
 
 
 from chia.types.blockchain_format.coin import Coin
@@ -25,10 +26,12 @@ from chia.types.announcement import Announcement
 
 from clvm.EvalError import EvalError
 
-from CreatorNFT.sim import load_clsp_relative
+from CreatorNFT.sim import load_clsp_relative, clsp_source_digest, CLSP_CACHE_DIR
 from CreatorNFT.sim import setup_node_only
 
 import CreatorNFT.driver as driver
+import CreatorNFT.signing as signing
+import CreatorNFT.preflight as preflight
 
 from CreatorNFT.nft_wallet import NFT
 
@@ -42,6 +45,8 @@ ESCAPE_VALUE = -113
 MELT_CONDITION = [ConditionOpcode.CREATE_COIN, 0, ESCAPE_VALUE]
 
 INNER_MOD = load_clsp_relative("clsp/creator_nft.clsp")
+# the driver launches new NFTs with v2, NFTs launched before it keep INNER_MOD
+INNER_MOD_V2 = load_clsp_relative("clsp/creator_nft_v2.clsp")
 P2_MOD = load_clsp_relative("clsp/p2_creator_nft.clsp")
 
 
@@ -78,11 +83,21 @@ class TestCreatorNft:
     async def test_clsp_compile(self):
         launcher = load_clsp_relative("clsp/nft_launcher.clsp")
         singleton = load_clsp_relative("clsp/creator_nft.clsp")
+        singleton_v2 = load_clsp_relative("clsp/creator_nft_v2.clsp")
         p2 = load_clsp_relative("clsp/p2_creator_nft.clsp")
         assert launcher
         assert singleton
+        assert singleton_v2
         assert p2
 
+    @pytest.mark.asyncio
+    async def test_clsp_cache(self):
+        source = Path("clsp/creator_nft.clsp").resolve()
+        digest = clsp_source_digest(source, [Path("include/").resolve()])
+        singleton = load_clsp_relative("clsp/creator_nft.clsp")
+        assert (Path(CLSP_CACHE_DIR) / f"{digest}.clvm").exists()
+        assert load_clsp_relative("clsp/creator_nft.clsp").get_tree_hash() == singleton.get_tree_hash()
+
     @pytest.mark.asyncio
     async def test_launcher_puzzle(self, node, alice):
         amount = 101
@@ -219,8 +234,8 @@ class TestCreatorNft:
         found_coin_puzzle = puzzle_for_pk(alice.pk_)
         launcher_coin = Coin(found_coin.name(), LAUNCHER_PUZZLE_HASH, amount)
 
-        args = [INNER_MOD.get_tree_hash(), state, royalty]
-        curried = INNER_MOD.curry(*args)
+        args = [INNER_MOD_V2.get_tree_hash(), state, royalty]
+        curried = INNER_MOD_V2.curry(*args)
         full_puzzle = SINGLETON_MOD.curry((SINGLETON_MOD_HASH, (launcher_coin.name(), LAUNCHER_PUZZLE_HASH)), curried)
         nft_full_puzzle_hash = full_puzzle.get_tree_hash()
 
@@ -253,8 +268,8 @@ class TestCreatorNft:
         # assert the output puzzlehash of eve spend.
         print(conds)
         next_ph = conds[1][1]
-        args = [INNER_MOD.get_tree_hash(), state, royalty]
-        curried = INNER_MOD.curry(*args)
+        args = [INNER_MOD_V2.get_tree_hash(), state, royalty]
+        curried = INNER_MOD_V2.curry(*args)
         full_puzzle = SINGLETON_MOD.curry((SINGLETON_MOD_HASH, (launcher_coin.name(), LAUNCHER_PUZZLE_HASH)), curried)
         print(next_ph)
         print(full_puzzle.get_tree_hash())
@@ -271,6 +286,51 @@ class TestCreatorNft:
         print(res)
         assert res["additions"]
 
+    @pytest.mark.asyncio
+    async def test_launch_chain(self, node, alice):
+        amount = 101
+        state = [0, 1000, alice.puzzle_hash, alice.pk_]
+        royalty = [alice.puzzle_hash, 25]
+        launches = [(amount, state, royalty, ("CreatorNFT", f"art {i}")) for i in range(3)]
+
+        found_coin = await alice.choose_coin(amount * 3)
+        found_coin_puzzle = puzzle_for_pk(alice.pk_)
+
+        # a budget for a single launch stops the chain after it
+        spends, launcher_ids, cost = driver.make_launch_chain(found_coin, found_coin_puzzle, launches, 10 ** 12)
+        _, one_id, _ = driver.make_launch_chain(found_coin, found_coin_puzzle, launches, cost // 3 + cost // 6)
+        assert one_id == launcher_ids[:1]
+        assert len(set(launcher_ids)) == 3
+
+        sb = await sign_coin_spends(
+            spends,
+            alice.pk_to_sk,
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+        )
+        # signing in worker processes gives the same aggregate
+        parallel_sb = await signing.sign_coin_spends(
+            spends,
+            alice.pk_to_sk,
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+            parallel_threshold=1,
+        )
+        assert parallel_sb.aggregated_signature == sb.aggregated_signature
+        # a bundle with fewer signatures than the threshold never asks for a pool
+        started = []
+        lazy_sb = await signing.sign_coin_spends(
+            spends,
+            alice.pk_to_sk,
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+            executor_factory=lambda: started.append(True),
+        )
+        assert lazy_sb.aggregated_signature == sb.aggregated_signature
+        assert not started
+        res = await node.push_tx(sb)
+        assert res["additions"]
+
     @pytest.mark.asyncio
     async def test_update_spend(self, node, alice, bob):
         amount = 101
@@ -306,6 +366,11 @@ class TestCreatorNft:
 
         new_state = [0, 10202, alice.puzzle_hash, alice.pk_]
         update_spend = driver.make_update_spend(nft, new_state)
+        # the spliced puzzle reveal is exactly what currying the mods makes
+        inner = INNER_MOD_V2.curry(INNER_MOD_V2.get_tree_hash(), nft.state(), nft.royalty)
+        full = SINGLETON_MOD.curry((SINGLETON_MOD_HASH, (nft.launcher_id, LAUNCHER_PUZZLE_HASH)), inner)
+        assert update_spend.puzzle_reveal == SerializedProgram.from_program(full)
+        assert nft.lineage_proof.inner_puzzle_hash == inner.get_tree_hash()
 
         sb = await sign_coin_spends(
             [update_spend],
@@ -337,6 +402,68 @@ class TestCreatorNft:
         print(res)
         assert res["additions"]
 
+    @pytest.mark.asyncio
+    async def test_v2_conditions_match_v1(self, alice, bob):
+        # curried with the same MOD_HASH, both inner puzzles must make identical conditions
+        mod_hash = INNER_MOD.get_tree_hash()
+        truths = Program.to(((b"\x01" * 32, b"\x02" * 32), ((b"\x03" * 32, 101), [])))
+        new_state = [0, 2000, bob.puzzle_hash, bob.pk_]
+        for royalty_pc in [0, 1, 25, 33, 100]:
+            for price in [0, 1, 999, 1001]:
+                state = [10, price, alice.puzzle_hash, alice.pk_]
+                royalty = [alice.puzzle_hash, royalty_pc]
+                v1 = INNER_MOD.curry(mod_hash, state, royalty)
+                v2 = INNER_MOD_V2.curry(mod_hash, state, royalty)
+                for payment_info in [[], b"\x04" * 32]:
+                    solution = Program.to([truths, new_state, payment_info])
+                    assert bytes(v2.run(solution)) == bytes(v1.run(solution))
+
+        not_for_sale = INNER_MOD_V2.curry(mod_hash, [0, 1000, alice.puzzle_hash, alice.pk_], royalty)
+        with pytest.raises(EvalError) as e:
+            not_for_sale.run(Program.to([truths, new_state, b"\x04" * 32]))
+        assert Program.to(e.value._sexp).first().as_python() == b"not for sale"
+
+    @pytest.mark.asyncio
+    async def test_v1_nft_still_spends(self, node, alice):
+        amount = 101
+        key_value_list = ("CreatorNFT", ["v0.1", "other data", "three"])
+        state = [0, 1000, alice.puzzle_hash, alice.pk_]
+        royalty = [alice.puzzle_hash, 25]
+
+        found_coin = await alice.choose_coin(amount)
+        launcher_spend = driver.make_launcher_spend(
+            found_coin, amount, state, royalty, key_value_list, INNER_MOD.get_tree_hash()
+        )
+        found_spend = driver.make_found_spend(found_coin, puzzle_for_pk(alice.pk_), launcher_spend, amount)
+        eve_spend = driver.make_eve_spend(state, royalty, launcher_spend)
+
+        sb = await sign_coin_spends(
+            [launcher_spend, found_spend, eve_spend],
+            alice.pk_to_sk,
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+        )
+        res = await node.push_tx(sb)
+        assert res["additions"]
+
+        nft_coin = driver.singleton_child(eve_spend)
+        nft = NFT(launcher_spend.coin.name(), nft_coin, eve_spend, key_value_list, royalty)
+        assert nft.mod_hash == INNER_MOD.get_tree_hash()
+        assert NFT.from_bytes(nft.to_bytes()).mod_hash == nft.mod_hash
+
+        update_spend = driver.make_update_spend(nft, [10, 2000, alice.puzzle_hash, alice.pk_])
+        sb = await sign_coin_spends(
+            [update_spend],
+            alice.pk_to_sk,
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+        )
+        res = await node.push_tx(sb)
+        assert res["additions"]
+        # the update recreates the v1 puzzle
+        nft = NFT(nft.launcher_id, driver.singleton_child(update_spend), update_spend, key_value_list, royalty)
+        assert nft.mod_hash == INNER_MOD.get_tree_hash()
+
     @pytest.mark.asyncio
     async def test_launch_and_buy(self, node, alice, bob):
         amount = 101
@@ -388,6 +515,47 @@ class TestCreatorNft:
 
         # buy a not-for-sale
 
+    @pytest.mark.asyncio
+    async def test_sweep_buy(self, node, alice, bob):
+        amount = 101
+        state = [10, 1000, alice.puzzle_hash, alice.pk_]
+        royalty = [alice.puzzle_hash, 25]
+        launches = [(amount, state, royalty, ("CreatorNFT", f"art {i}")) for i in range(2)]
+
+        found_coin = await alice.choose_coin(amount * 2)
+        spends, launcher_ids, _ = driver.make_launch_chain(found_coin, puzzle_for_pk(alice.pk_), launches, 10 ** 12)
+        sb = await sign_coin_spends(
+            spends,
+            alice.pk_to_sk,
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+        )
+        res = await node.push_tx(sb)
+        assert res["additions"]
+
+        nfts = []
+        for launcher_id, eve_spend in zip(launcher_ids, spends[2::3]):
+            nft_coin = next(c for c in res["additions"] if c.parent_coin_info == eve_spend.coin.name())
+            nfts.append(NFT(launcher_id, nft_coin, eve_spend, launches[0][3], royalty))
+
+        # every coin bob has pays together, the change goes back to the first one's puzzle hash
+        payment_coins = [(coin, bob.puzzle) for coin in bob.usable_coins.values()]
+        new_state = [0, 2000, bob.puzzle_hash, bob.pk_]
+        spends = driver.make_sweep_buy_spends([(nft, new_state) for nft in nfts], payment_coins)
+        report = preflight.preflight(spends, DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM)
+        assert report.spends == len(spends)
+        assert report.cost == sum(driver.spend_cost(cs) for cs in spends)
+        sb = await sign_coin_spends(
+            spends,
+            bob.pk_to_sk,
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+            DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
+        )
+        res = await node.push_tx(sb)
+        assert res["additions"]
+        for nft in nfts:
+            assert any(c.parent_coin_info == nft.name() and c.amount == amount for c in res["additions"])
+
     @pytest.mark.asyncio
     async def test_buy_not_for_sale(self, node, alice, bob):
         amount = 101
@@ -422,14 +590,16 @@ class TestCreatorNft:
         )
 
         nft = NFT(launcher_coin.name(), nft_coin, eve_spend, key_value_list, royalty)
+        restored = NFT.from_bytes(nft.to_bytes())
+        assert restored.name() == nft.name()
+        assert restored.state() == nft.state()
+        assert restored.lineage_proof == nft.lineage_proof
 
         new_state = [0, 10202, bob.puzzle_hash, bob.pk_]
 
-        old_state, royalty = driver.uncurry_state_and_royalty(nft.last_spend.puzzle_reveal.to_program())
-        current_state = driver.uncurry_solution(nft.last_spend.solution.to_program())
-        args = [INNER_MOD.get_tree_hash(), current_state, royalty]
+        args = [INNER_MOD_V2.get_tree_hash(), nft.state(), nft.royalty]
 
-        current_inner_puzzle = INNER_MOD.curry(*args)
+        current_inner_puzzle = INNER_MOD_V2.curry(*args)
         current_singleton_puzzle = SINGLETON_MOD.curry(
             (SINGLETON_MOD_HASH, (nft.launcher_id, LAUNCHER_PUZZLE_HASH)), current_inner_puzzle
         )
@@ -442,15 +612,7 @@ class TestCreatorNft:
         p2_puzzle = P2_MOD.curry(SINGLETON_MOD_HASH, nft.launcher_id, LAUNCHER_PUZZLE_HASH)
         p2_coin = Coin(payment_coin.name(), p2_puzzle.get_tree_hash(), price)
 
-        r = nft.last_spend.puzzle_reveal.to_program().uncurry()
-        if r is not None:
-            _, args = r
-            _, inner_puzzle = list(args.as_iter())
-            inner_puzzle_hash = inner_puzzle.get_tree_hash()
-
-        lineage_proof = LineageProof(nft.last_spend.coin.parent_coin_info, inner_puzzle_hash, nft.amount)
-
-        # lineage_proof = singleton_top_layer.lineage_proof_for_coinsol(nft.last_spend)
+        lineage_proof = nft.lineage_proof
 
         inner_solution = [new_state, p2_coin.name(), 0]
         singleton_solution = singleton_top_layer.solution_for_singleton(
@@ -479,6 +641,8 @@ class TestCreatorNft:
                 DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
                 DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM,
             )
+        with pytest.raises(preflight.PreflightError, match="not for sale"):
+            preflight.preflight([nft_spend, p2_spend, payment_spend], DEFAULT_CONSTANTS.MAX_BLOCK_COST_CLVM)
 
     @pytest.mark.asyncio
     async def test_multiple_buys_and_updates(self, node, alice, bob, carol):
@@ -0,0 +1,77 @@
+"""Spends per second built by the driver for bundles covering many NFTs.
+
+Run from the repository root:
+
+    python -m tests.util.benchmark_driver [-n NFTS] [-r RUNS]
+
+NFTS for-sale NFTs are launched by the driver for fixed keys and coins, then their
+update, buy and sweep-buy spends are built RUNS times. Only building is timed:
+nothing is run, signed or pushed.
+"""
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from blspy import AugSchemeMPL
+
+from chia.types.blockchain_format.coin import Coin
+from chia.util.hash import std_hash
+from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import puzzle_for_pk
+
+import driver
+from nft_wallet import NFT
+from tests.util.benchmark_puzzles import AMOUNT, FUNDS, NFT_DATA, PRICE
+
+
+def make_nfts(count: int) -> List[NFT]:
+    creator_pk = AugSchemeMPL.key_gen(b"\x01" * 32).get_g1()
+    creator_ph = puzzle_for_pk(creator_pk).get_tree_hash()
+    state = [10, PRICE, creator_ph, creator_pk]
+    royalty = [creator_ph, 25]
+
+    nfts = []
+    for i in range(count):
+        found_coin = Coin(std_hash(b"found" + i.to_bytes(4, "big")), creator_ph, FUNDS)
+        launcher_spend = driver.make_launcher_spend(found_coin, AMOUNT, state, royalty, NFT_DATA)
+        eve_spend = driver.make_eve_spend(state, royalty, launcher_spend)
+        nfts.append(NFT(launcher_spend.coin.name(), driver.singleton_child(eve_spend), eve_spend, NFT_DATA, royalty))
+    return nfts
+
+
+def builders(nfts: List[NFT]) -> Dict[str, Callable[[], List]]:
+    buyer_pk = AugSchemeMPL.key_gen(b"\x02" * 32).get_g1()
+    buyer_puzzle = puzzle_for_pk(buyer_pk)
+    buyer_state = [0, PRICE, buyer_puzzle.get_tree_hash(), buyer_pk]
+    payment_coin = Coin(std_hash(b"payment"), buyer_puzzle.get_tree_hash(), FUNDS)
+
+    return {
+        "update": lambda: [driver.make_update_spend(nft, buyer_state) for nft in nfts],
+        "buy": lambda: [
+            spend for nft in nfts for spend in driver.make_buy_spend(nft, buyer_state, payment_coin, buyer_puzzle)
+        ],
+        "sweep-buy": lambda: driver.make_sweep_buy_spends(
+            [(nft, buyer_state) for nft in nfts], [(payment_coin, buyer_puzzle)]
+        ),
+    }
+
+
+def spends_per_second(build: Callable[[], List], runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        spends = build()
+        times.append(time.perf_counter() - start)
+    return len(spends) / statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--nfts", type=int, default=100)
+    parser.add_argument("-r", "--runs", type=int, default=5)
+    options = parser.parse_args()
+
+    nfts = make_nfts(options.nfts)
+    print(f"{'bundle':<10} {'spends/s':>10}")
+    for name, build in builders(nfts).items():
+        print(f"{name:<10} {spends_per_second(build, options.runs):>10.0f}")
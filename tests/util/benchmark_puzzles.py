@@ -0,0 +1,134 @@
+"""CLVM cost, serialized size and wall time of every creator NFT spend path.
+
+Run from the repository root:
+
+    python -m tests.util.benchmark_puzzles [-r RUNS] [--update]
+
+Each path (launch, eve, update and trade) is built by the driver at 0%, 25% and
+100% royalty for fixed keys and coins, so its cost only changes when a puzzle or
+the driver does. Paths prefixed v1/ run the original inner puzzle, which NFTs
+launched before creator_nft_v2.clsp still use. --update rewrites the baselines that tests/test_puzzle_costs.py
+holds every path to. Record them with the chia-blockchain release the tests run against (1.2.11, with its
+pinned clvm_rs 0.1.15), since other CLVM runtimes can price the same spends differently.
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from blspy import AugSchemeMPL
+
+from chia.consensus.default_constants import DEFAULT_CONSTANTS
+from chia.types.blockchain_format.coin import Coin
+from chia.types.coin_spend import CoinSpend
+from chia.util.hash import std_hash
+from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import puzzle_for_pk
+
+import driver
+import preflight
+import puzzles
+from nft_wallet import NFT
+
+
+BASELINES = Path(__file__).with_name("puzzle_cost_baselines.json")
+# a path fails the regression test once it costs this fraction more than its baseline
+COST_THRESHOLD = 0.02
+ROYALTIES = [0, 25, 100]
+# path prefix for each inner puzzle, by its attribute in puzzles
+INNER_MODS = {"": "INNER_MOD_V2_HASH", "v1/": "INNER_MOD_HASH"}
+AMOUNT = 101
+PRICE = 1000
+FUNDS = 10 ** 12
+NFT_DATA = ("CreatorNFT", "benchmark")
+
+
+def benchmark_spends() -> Dict[str, List[CoinSpend]]:
+    """The spends of each path that run this repo's puzzles, keyed path/royalty"""
+    creator_pk = AugSchemeMPL.key_gen(b"\x01" * 32).get_g1()
+    buyer_pk = AugSchemeMPL.key_gen(b"\x02" * 32).get_g1()
+    creator_ph = puzzle_for_pk(creator_pk).get_tree_hash()
+    buyer_ph = puzzle_for_pk(buyer_pk).get_tree_hash()
+
+    paths = {}
+    for prefix, royalty_pc in [(prefix, pc) for prefix in INNER_MODS for pc in ROYALTIES]:
+        state = [10, PRICE, creator_ph, creator_pk]
+        royalty = [creator_ph, royalty_pc]
+        found_coin = Coin(std_hash(b"found" + bytes([royalty_pc])), creator_ph, FUNDS)
+        inner_mod_hash = getattr(puzzles, INNER_MODS[prefix])
+        launcher_spend = driver.make_launcher_spend(found_coin, AMOUNT, state, royalty, NFT_DATA, inner_mod_hash)
+        eve_spend = driver.make_eve_spend(state, royalty, launcher_spend)
+        nft = NFT(launcher_spend.coin.name(), driver.singleton_child(eve_spend), eve_spend, NFT_DATA, royalty)
+
+        update_spend = driver.make_update_spend(nft, [0, PRICE * 2, creator_ph, creator_pk])
+        payment_coin = Coin(std_hash(b"payment" + bytes([royalty_pc])), buyer_ph, FUNDS)
+        nft_spend, p2_spend, _ = driver.make_buy_spend(
+            nft, [0, PRICE, buyer_ph, buyer_pk], payment_coin, puzzle_for_pk(buyer_pk)
+        )
+
+        paths[f"{prefix}launch/{royalty_pc}"] = [launcher_spend]
+        paths[f"{prefix}eve/{royalty_pc}"] = [eve_spend]
+        paths[f"{prefix}update/{royalty_pc}"] = [update_spend]
+        # the standard transaction paying for it is the buyer's wallet, not ours
+        paths[f"{prefix}trade/{royalty_pc}"] = [nft_spend, p2_spend]
+    return paths
+
+
+def measure(spends: List[CoinSpend], runs: int) -> Dict:
+    clvm_cost = condition_cost = 0
+    for coin_spend in spends:
+        cost, conditions = preflight.run_spend(coin_spend)
+        clvm_cost += cost
+        condition_cost += preflight.conditions_cost(conditions)
+    size = sum(preflight.spend_size(coin_spend) for coin_spend in spends)
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for coin_spend in spends:
+            preflight.run_spend(coin_spend)
+        times.append(time.perf_counter() - start)
+
+    return {
+        "cost": clvm_cost + condition_cost + size * DEFAULT_CONSTANTS.COST_PER_BYTE,
+        "clvm_cost": clvm_cost,
+        "condition_cost": condition_cost,
+        "size": size,
+        "seconds": statistics.median(times),
+    }
+
+
+def measure_all(runs: int = 1) -> Dict[str, Dict]:
+    return {path: measure(spends, runs) for path, spends in benchmark_spends().items()}
+
+
+def load_baselines() -> Dict[str, Dict]:
+    return json.loads(BASELINES.read_text())
+
+
+def save_baselines(results: Dict[str, Dict]) -> None:
+    # wall time depends on the machine, so only the deterministic numbers are kept
+    baselines = {path: {k: v for k, v in result.items() if k != "seconds"} for path, result in results.items()}
+    BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--runs", type=int, default=100)
+    parser.add_argument("--update", action="store_true", help="Record these results as the new baselines")
+    options = parser.parse_args()
+
+    results = measure_all(options.runs)
+    baselines = load_baselines() if BASELINES.exists() else {}
+    print(f"{'path':<15} {'cost':>12} {'clvm':>10} {'conds':>10} {'bytes':>6} {'time':>10}  vs baseline")
+    for path, result in results.items():
+        baseline = baselines.get(path, {}).get("cost")
+        change = f"{result['cost'] / baseline - 1:+.2%}" if baseline else "-"
+        print(
+            f"{path:<15} {result['cost']:>12} {result['clvm_cost']:>10} {result['condition_cost']:>10} "
+            f"{result['size']:>6} {result['seconds'] * 1000:>8.3f}ms  {change}"
+        )
+    if options.update:
+        save_baselines(results)
+        print(f"\nBaselines written to {BASELINES}")
@@ -0,0 +1,50 @@
+"""Wall time of `nft` commands, measured in fresh processes.
+
+Run from the repository root:
+
+    python tests/util/benchmark_startup.py [-r RUNS] [-n NFT_ID]
+
+`nft view` is only timed when an NFT id is given. With `nft daemon` running it
+should answer from the local store; without it the time includes connecting to
+the node and syncing.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def time_process(code: str, args, runs: int):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code, *args], cwd=ROOT, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def time_command(args, runs: int):
+    return time_process("import nft; nft.main()", args, runs)
+
+
+def report(name: str, times):
+    print(f"{name:<24} median {statistics.median(times):.3f}s  min {min(times):.3f}s  max {max(times):.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--runs", type=int, default=5)
+    parser.add_argument("-n", "--nft-id", type=str, default=None)
+    options = parser.parse_args()
+
+    report("python startup", time_process("pass", [], options.runs))
+    report("nft --help", time_command(["--help"], options.runs))
+    if options.nft_id:
+        report("nft view", time_command(["view", "-n", options.nft_id], options.runs))
+    # import time of each module on its own, to spot what a command pulls in
+    for module in ["nft", "nft_manager", "puzzles", "sim"]:
+        report(f"import {module}", time_process(f"import {module}", [], options.runs))